@@ -29,22 +29,30 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import datetime
+import getopt
 import json
 import re
 import sys
 
 from bs4 import BeautifulSoup
 
+from adjacency import adjacencyName, writeAdjacency
+from manifest import writeManifest
+from shpfile import iterShapes
+from tiles import tilesName, writeTiles
+from topo import topoName, writeTopology
+
 __doc__ = """
 This script extracts ABS Mesh Block names (SA1), Suburb/Locality
 names (SA2) and polygon points from the ABS' SA1 dataset after
 conversion with ogr2ogr.
 
-Once the data has been extracted we dump it to a file in JSON format.
+Once the data has been extracted we dump it to a file in JSON format,
+with a per-electorate manifest (see manifest.py) alongside.
 
-This is a *very* quick-n-dirty script - it takes two arguments (only);
+This is a *very* quick-n-dirty script - it takes two arguments;
 the first is the ABS' CSV-formatted mesh block to State Electoral Division
-file, the second is the mesh block kml.
+file, the second is the mesh block kml, or the ABS' original shapefile.
 
 TODO: Each time there is a redistribution of electorates, this script
 must be re-run.
@@ -61,10 +69,28 @@ usagestr = """
 USAGE
 -----
 
-SA1-to-mbpt.py SEDfile.csv MB.kml
+SA1-to-mbpt.py [-A] [-T] [-Z zoom] [--only XX,YY] SEDfile.csv MB.kml
 
     SEDfile.csv is the ABS' CSV-formatted Mesh Block / Electorate file
     MB.kml is the ABS' kml containing all the Mesh Blocks in Australia.
+    If it ends in .shp, it's read directly as the ABS' shapefile (with
+    its .shx and .dbf alongside), with no need for ogr2ogr.
+
+    -A also writes which divisions border each other within each
+    jurisdiction, and the length of each shared border (see
+    adjacency.py), in XX.json.adjacency. Run adjacency.py over all of
+    the XX.json files for borders between jurisdictions too.
+
+    -T also writes each jurisdiction as a shared-arc topology (see
+    topo.py), in XX.topo.json alongside XX.json.
+
+    -Z also shards each jurisdiction into map tiles at zoom level zoom
+    (see tiles.py), under XX.tiles/ alongside XX.json.
+
+    --only limits the run to the listed jurisdictions (out of ACT, NSW,
+    NT, QLD, SA, TAS, VIC and WA), and writes only their files. Mesh
+    blocks in any other jurisdiction are skipped without decoding their
+    coordinates.
 
 """
 
@@ -98,6 +124,9 @@ mb_to_sed = {}
 # Convenience mapping of each state's electoral divisions.
 perstate_ed = {}
 
+# Abbreviations of the jurisdictions we want, or None for all of them
+onlyjuris = None
+
 # SA1 as BeautifulSoup
 sakml = ""
 
@@ -127,6 +156,8 @@ def process_csv(csvfile):
         # Skip the Other Territories
         if juris == "Other Territories" or ignoRE.match(sed):
             continue
+        if onlyjuris is not None and alljuris[juris] not in onlyjuris:
+            continue
         if juris not in perstate_ed:
             perstate_ed[juris] = {"localities": set()}
         cleaned = re.split(" \(", sed)[0]
@@ -159,6 +190,43 @@ def mb_to_points(area):
     return coords
 
 
+#
+def gml_blocks(gmlfn):
+    """
+    Yields (sa1, points) for each mesh block in the ogr2ogr-converted
+    file gmlfn. Mesh blocks which aren't in a division we're writing out
+    are skipped before we go to the trouble of decoding them.
+    Sets global variable sakml
+    """
+    global sakml
+    kmlf = open(gmlfn, "r")
+    sakml = BeautifulSoup(kmlf.read(), "xml")
+    kmlf.close()
+
+    print("[{nowish}] kmlf turned into soup".format(nowish=prettytime()))
+
+    for feature in sakml.findAll("gml:featureMember"):
+        sa1 = feature.find("ogr:SA1_MAIN16").text
+        if sa1 not in mb_to_sed:
+            continue
+        yield sa1, mb_to_points(feature)
+
+
+#
+def shp_blocks(shpfn):
+    """
+    Yields (sa1, points) for each mesh block in the ABS shapefile shpfn,
+    skipping those we don't want as gml_blocks() does. Every ring of
+    the mesh block goes into points, just as for the GML.
+    """
+    def wanted(record):
+        return str(record.get("SA1_MAIN16")) in mb_to_sed
+
+    for record, parts in iterShapes(shpfn, wanted):
+        yield str(record["SA1_MAIN16"]), [pt for part in parts
+                                          for pt in part]
+
+
 #
 def prettytime():
     """ returns formatted time string """
@@ -168,29 +236,36 @@ def prettytime():
 
 if __name__ == "__main__":
 
-    if len(sys.argv) < 3:
+    opts, args = getopt.getopt(sys.argv[1:], "ATZ:", ["only="])
+    dopts = dict(opts)
+
+    if len(args) < 2:
         usage()
         sys.exit(1)
 
+    if "--only" in dopts:
+        onlyjuris = set(dopts["--only"].upper().split(","))
+        known = set(alljuris.values()) - set(["(OT)"])
+        if not onlyjuris <= known:
+            print("Invalid jurisdiction {0} specified. Please use values "
+                  "from {1}".format(", ".join(sorted(onlyjuris - known)),
+                                    ", ".join(sorted(known))))
+            sys.exit(3)
+
     # Open the CSV file
-    with open(sys.argv[1], "r") as csvinf:
+    with open(args[0], "r") as csvinf:
         mbcsv = csvinf.readlines()
     process_csv(mbcsv[1:])
     print("[{nowish}] CSV processed".format(nowish=prettytime()))
 
-    # Open the SA1 kml
-    kmlf = open(sys.argv[2], "r")
-    # Now we start the interesting bits
-    sakml = BeautifulSoup(kmlf.read(), "xml")
-    kmlf.close()
-
-    print("[{nowish}] kmlf turned into soup".format(nowish=prettytime()))
-
-    # Add the SA1s as attributes to each gml:featureMember, to ease
-    # lookups.
-    for feature in sakml.findAll("gml:featureMember"):
-        sa1 = feature.find("ogr:SA1_MAIN16").text
-        mb_coord[sa1] = mb_to_points(feature)
+    # Open the SA1 kml (or shapefile), and associate the coordinates
+    # with each SA1 we want, to ease lookups.
+    if args[1].endswith(".shp"):
+        blocks = shp_blocks(args[1])
+    else:
+        blocks = gml_blocks(args[1])
+    for sa1, points in blocks:
+        mb_coord[sa1] = points
     print("[{nowish}] coordinates for mesh blocks associated".format(
         nowish=prettytime()))
 
@@ -202,7 +277,7 @@ if __name__ == "__main__":
 
     # Time to write things out - on a per-jurisdiction basis
     for k in alljuris:
-        if k == "Other Territories":
+        if k == "Other Territories" or k not in perstate_ed:
             continue
         runlist = list(perstate_ed[k]["localities"])
         runlist.sort()
@@ -213,4 +288,11 @@ if __name__ == "__main__":
         print("writing to {fname}".format(fname=fname))
         with open(fname, "w") as outf:
             json.dump(outj, outf)
+        writeManifest(fname, outj)
+        if "-A" in dopts:
+            writeAdjacency(adjacencyName(fname), outj, sources=[fname])
+        if "-T" in dopts:
+            writeTopology(topoName(fname), outj)
+        if "-Z" in dopts:
+            writeTiles(tilesName(fname), outj, int(dopts["-Z"]))
     print("[{nowish}] all done".format(nowish=prettytime()))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import json
+import math
+import os
+import sys
+
+from topo import DIGITS, quantise, readElectorates, splitRings
+
+__doc__ = """
+Electorate adjacency, from the shared borders in the JSON files written
+by SA1-to-mbpt.py, electorates.py and austwide.py.
+
+Neighbouring electorates from the same source walk exactly the same
+points along their common border. So rather than comparing every pair
+of polygons, we hash each boundary edge (with its points rounded to a
+fixed number of decimal places, and its ends in a canonical order) and
+note each electorate it belongs to. An edge owned by two electorates
+is part of their shared border, and its great circle length goes into
+that border's length. That's one pass over the points, whatever the
+number of electorates.
+
+Each output file foo.json gets a foo.json.adjacency alongside it,
+giving for every electorate its jurisdiction and its neighbours, each
+with the neighbour's jurisdiction and the shared border length in km.
+Electorates which only touch at a corner aren't neighbours.
+"""
+
+usagestr = """
+
+USAGE
+-----
+
+adjacency.py [-q digits] [-o outfile] file.json [file.json ...]
+
+    Work out the adjacency of the electorates in all of the files
+    (output of SA1-to-mbpt.py, electorates.py or austwide.py) taken
+    together, so that borders between jurisdictions are found too, and
+    write it to outfile (default: the first file with .adjacency
+    appended). Points are matched to digits decimal places (default 6).
+    An electorate name found in more than one of the files is an error.
+
+"""
+
+SUFFIX = ".adjacency"
+
+# Mean radius of the Earth, in km
+RADIUS = 6371.0088
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def adjacencyName(outfn):
+    """Returns the adjacency filename for the output file outfn"""
+    return outfn + SUFFIX
+
+
+def edgeLength(a, b, scale):
+    """Returns the great circle length in km of the quantised edge a-b"""
+    lon1, lat1 = math.radians(a[0] / scale), math.radians(a[1] / scale)
+    lon2, lat2 = math.radians(b[0] / scale), math.radians(b[1] / scale)
+    hav = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) *
+           math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RADIUS * math.asin(min(1.0, math.sqrt(hav)))
+
+
+def buildAdjacency(electorates, digits=DIGITS):
+    """
+    Returns {name: {"jurisdiction": ..., "neighbours": {other:
+    {"jurisdiction": ..., "border": km}}}} for electorates, a name:
+    details mapping in which each details has a "coords" list.
+    """
+    scale = 10 ** digits
+    owners = {}
+    borders = {}
+    for ename, details in electorates.items():
+        # Walk each ring on its own, so that the end of one mesh block
+        # isn't joined to the start of the next
+        for ring in splitRings(details["coords"]):
+            line = quantise(ring, digits)
+            for k in range(1, len(line)):
+                a, b = line[k - 1], line[k]
+                if a == b:
+                    continue
+                edge = (a, b) if a < b else (b, a)
+                owner = owners.setdefault(edge, ename)
+                if owner == ename:
+                    continue
+                pair = (owner, ename) if owner < ename else (ename, owner)
+                borders[pair] = borders.get(pair, 0.0) + \
+                    edgeLength(a, b, scale)
+
+    adjacency = dict((ename, {
+        "jurisdiction": details.get("jurisdiction"),
+        "neighbours": {}
+    }) for ename, details in electorates.items())
+    for (left, right), length in borders.items():
+        adjacency[left]["neighbours"][right] = {
+            "jurisdiction": electorates[right].get("jurisdiction"),
+            "border": round(length, 3)
+        }
+        adjacency[right]["neighbours"][left] = {
+            "jurisdiction": electorates[left].get("jurisdiction"),
+            "border": round(length, 3)
+        }
+    return adjacency
+
+
+def writeAdjacency(outfn, electorates, digits=DIGITS, sources=None):
+    """
+    Writes the adjacency of electorates to outfn. sources is the list
+    of files the electorates came from.
+    """
+    with open(outfn, "w") as adjf:
+        json.dump({
+            "sources": sources or [],
+            "digits": digits,
+            "electorates": buildAdjacency(electorates, digits)
+        }, adjf, indent=1, sort_keys=True)
+
+
+def readAdjacency(adjfn):
+    """Returns the name: {jurisdiction, neighbours} mapping in adjfn"""
+    with open(adjfn, "r") as adjf:
+        return json.load(adjf)["electorates"]
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "ho:q:")
+    dopts = dict(opts)
+
+    if "-h" in dopts or len(args) < 1:
+        usage()
+        sys.exit(0 if "-h" in dopts else 1)
+
+    try:
+        electorates = readElectorates(args)
+    except ValueError as _err:
+        print("Error: {0}".format(_err), file=sys.stderr)
+        sys.exit(1)
+
+    writeAdjacency(dopts.get("-o", adjacencyName(args[0])), electorates,
+                   int(dopts.get("-q", DIGITS)),
+                   [os.path.basename(fname) for fname in args])
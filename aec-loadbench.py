@@ -0,0 +1,150 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+__doc__ = """
+Measures postcode.py throughput and latency against a LocalitySearchResults
+server - normally an aec-standin.py instance - at several concurrency
+levels. Each query is a complete postcode.py invocation, so the numbers
+include interpreter startup, validation and parsing as well as the
+network round trips.
+
+    aec-standin.py -g 120 -l 50 -j 20 &
+    aec-loadbench.py -c 1,4,16 -n 64 2000 2010 3000
+"""
+
+usagestr = """
+
+aec-loadbench.py [-u url] [-c levels] [-n queries] [-k] postcode [...]
+
+    -u  LocalitySearchResults.aspx URL
+        (default http://localhost:8080/LocalitySearchResults.aspx)
+    -c  comma-separated concurrency levels (default 1,2,4,8)
+    -n  number of queries to run at each level (default 32)
+    -k  let postcode.py use its results cache (a private one for this
+        run); by default every query goes to the server
+
+"""
+
+postcodepy = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "postcode.py")
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already-sorted list"""
+    idx = max(0, int(round(pct / 100.0 * len(values))) - 1)
+    return values[min(idx, len(values) - 1)]
+
+
+def runone(cmd):
+    """Runs a single postcode.py query, returns (seconds, succeeded)"""
+    start = time.perf_counter()
+    res = subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start, res.returncode == 0
+
+
+def runlevel(cmds, concurrency):
+    """Runs cmds with the given concurrency, returns a stats dict"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(runone, cmds))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(secs for secs, _ok in outcomes)
+    return {
+        "concurrency": concurrency,
+        "queries": len(outcomes),
+        "errors": sum(1 for _secs, ok in outcomes if not ok),
+        "qps": len(outcomes) / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p90": percentile(latencies, 90) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "max": latencies[-1] * 1000
+    }
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "c:hkn:u:")
+    dopts = dict(opts)
+
+    if "-h" in dopts or len(args) < 1:
+        usage()
+        sys.exit(0 if "-h" in dopts else 1)
+
+    url = dopts.get("-u",
+                    "http://localhost:8080/LocalitySearchResults.aspx")
+    levels = [int(c) for c in dopts.get("-c", "1,2,4,8").split(",")]
+    nqueries = int(dopts.get("-n", 32))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # postcode.py validates against a CSV, so give it one which
+        # knows about exactly the postcodes we're asking for.
+        csvpath = os.path.join(tmpdir, "au_postal_codes.csv")
+        with open(csvpath, "w") as csvf:
+            csvf.write("Postcode,Locality\n")
+            for pcode in args:
+                csvf.write("{0},BENCHMARK\n".format(pcode))
+
+        basecmd = [sys.executable, postcodepy, "-p", csvpath, "-u", url]
+        if "-k" in dopts:
+            basecmd += ["-d", os.path.join(tmpdir, "cache.sqlite")]
+        else:
+            basecmd += ["-n"]
+        cmds = [basecmd + [args[i % len(args)]] for i in range(nqueries)]
+
+        layout = "{0:>11} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}"
+        print(layout.format("Concurrency", "Queries", "Errors", "Query/s",
+                            "p50 (ms)", "p90 (ms)", "p99 (ms)", "max (ms)"))
+        failed = False
+        for level in levels:
+            res = runlevel(cmds, level)
+            failed = failed or res["errors"] == res["queries"]
+            print(layout.format(
+                res["concurrency"], res["queries"], res["errors"],
+                "{0:.2f}".format(res["qps"]), "{0:.1f}".format(res["p50"]),
+                "{0:.1f}".format(res["p90"]), "{0:.1f}".format(res["p99"]),
+                "{0:.1f}".format(res["max"])))
+    sys.exit(1 if failed else 0)
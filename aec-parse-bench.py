@@ -0,0 +1,111 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import sys
+import time
+
+import postcode
+
+
+__doc__ = """
+Compares the time taken to extract results from saved AEC
+LocalitySearchResults pages using postcode.py's streaming extractor
+(parseResults) against the original whole-page BeautifulSoup parse
+(parseResultsSoup). Both must produce the same results rows.
+
+Save pages with your browser or curl, eg
+
+    curl -d '' -o 2000.html \\
+      'https://electorate.aec.gov.au/LocalitySearchResults.aspx?filter=2000&filterby=Postcode'
+"""
+
+usagestr = """
+
+aec-parse-bench.py [-n iterations] page.html [page.html ...]
+
+    iterations is the number of times each page is parsed by each
+    method (default 20).
+
+"""
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def timeit(func, text, iterations):
+    """Returns the (results, mean seconds per call) of func over text"""
+    start = time.perf_counter()
+    for _i in range(iterations):
+        postcode.payload.clear()
+        postcode.followups.clear()
+        results = func(text, True)
+    return results, (time.perf_counter() - start) / iterations
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "hn:")
+    dopts = dict(opts)
+
+    if "-h" in dopts or len(args) < 1:
+        usage()
+        sys.exit(0 if "-h" in dopts else 1)
+
+    iterations = int(dopts.get("-n", 20))
+
+    layout = "{0:30} {1:>6} {2:>12} {3:>12} {4:>8}"
+    print(layout.format("Page", "Rows", "soup (ms)", "stream (ms)",
+                        "Speedup"))
+    totsoup = totstream = 0.0
+    mismatch = False
+    for fname in args:
+        with open(fname, "r") as pagef:
+            text = pagef.read()
+        soupres, souptime = timeit(postcode.parseResultsSoup, text,
+                                   iterations)
+        streamres, streamtime = timeit(postcode.parseResults, text,
+                                       iterations)
+        if soupres != streamres:
+            print("{0}: results differ between parsers".format(fname),
+                  file=sys.stderr)
+            mismatch = True
+        totsoup += souptime
+        totstream += streamtime
+        print(layout.format(fname[-30:], len(streamres), "{0:.3f}".format(
+            souptime * 1000), "{0:.3f}".format(streamtime * 1000),
+                            "{0:.1f}x".format(souptime / streamtime)))
+    print(layout.format("TOTAL", "", "{0:.3f}".format(totsoup * 1000),
+                        "{0:.3f}".format(totstream * 1000),
+                        "{0:.1f}x".format(totsoup / totstream)))
+    sys.exit(1 if mismatch else 0)
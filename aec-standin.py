@@ -0,0 +1,234 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import os
+import random
+import re
+import sys
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+__doc__ = """
+A local stand-in for https://electorate.aec.gov.au, so that postcode.py
+can be tested and benchmarked offline. Point postcode.py at it with
+
+    postcode.py -u http://localhost:8080/LocalitySearchResults.aspx 2000
+
+Recorded pages are read from a directory, one file per postcode and
+results page:
+
+    2000.html          first page for postcode 2000
+    2000-Page$2.html   what the AEC returned for the Page$2 postback
+
+Paging follows the ASP.NET postback conventions the real site uses: a
+POST carrying __VIEWSTATE and __EVENTARGUMENT=Page$N gets page N, a
+paging POST without __VIEWSTATE is rejected. Postcodes with no
+recording get an empty results grid, or with -g a synthesised one.
+"""
+
+usagestr = """
+
+aec-standin.py [-p port] [-d dir] [-g rows] [-l ms] [-j ms] [-e rate]
+
+    -p  port to listen on (default 8080)
+    -d  directory of recorded pages (default .)
+    -g  synthesise pages with this many localities for postcodes that
+        have no recording
+    -l  mean latency to add to every response, in milliseconds
+    -j  +/- jitter applied to the latency, in milliseconds
+    -e  fraction (0.0 - 1.0) of requests which fail with a 500
+
+"""
+
+pageRows = 50
+tblAttr = "ContentPlaceHolderBody_gridViewLocalities"
+eventTgt = "ctl00$ContentPlaceHolderBody$gridViewLocalities"
+
+PAGE_TMPL = """<html><head><title>Locality search results</title></head>
+<body><form method="post" action="./LocalitySearchResults.aspx">
+<div class="aspNetHidden">
+<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />
+<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{state}" />
+</div>
+<table class="resultsTable" id="{tbl}">
+<tr><th>State</th><th>Locality/Suburb</th><th>Postcode</th>
+<th>Electorate</th><th>Redistributed Electorate</th><th>Other Locality</th></tr>
+{rows}</table>
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{state}" />
+</form></body></html>
+"""
+
+ROW_TMPL = ("<tr><td>{state}</td><td>{locality}</td><td>{postcode}</td>"
+            "<td>{electorate}</td><td>&nbsp;</td><td>&nbsp;</td></tr>\n")
+
+PAGER_TMPL = ('<tr class="pagingLink"><td colspan="6"><table><tr>'
+              '{links}</tr></table></td></tr>\n')
+
+LINK_TMPL = ("<td><a href=\"javascript:__doPostBack(&#39;{tgt}&#39;,"
+             "&#39;Page${n}&#39;)\">{n}</a></td>")
+
+# Settings, filled in from the command line
+recdir = "."
+synthrows = 0
+latency = 0.0
+jitter = 0.0
+errorrate = 0.0
+
+stats = {"requests": 0, "errors": 0, "injected": 0}
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def synthPage(postcode, page):
+    """Returns a generated results page, or None past the last page"""
+    npages = max(1, (synthrows + pageRows - 1) // pageRows)
+    if page > npages:
+        return None
+    first = (page - 1) * pageRows
+    rows = "".join(ROW_TMPL.format(
+        state="NSW", locality="LOCALITY {0}".format(i), postcode=postcode,
+        electorate="Electorate {0}".format(i % 7))
+                   for i in range(first, min(first + pageRows, synthrows)))
+    if npages > 1:
+        rows += PAGER_TMPL.format(links="".join(
+            LINK_TMPL.format(tgt=eventTgt, n=n) if n != page else
+            "<td><span>{0}</span></td>".format(n)
+            for n in range(1, npages + 1)))
+    return PAGE_TMPL.format(state="standin-{0}".format(postcode),
+                            tbl=tblAttr, rows=rows)
+
+
+def findPage(postcode, page):
+    """
+    Returns the recorded (or synthesised) text of the given page, or None
+    if there isn't one.
+    """
+    if page == 1:
+        names = ["{0}.html".format(postcode)]
+    else:
+        names = ["{0}-Page${1}.html".format(postcode, page)]
+    for name in names:
+        path = os.path.join(recdir, name)
+        if os.path.exists(path):
+            with open(path, "r") as pagef:
+                return pagef.read()
+    if synthrows:
+        return synthPage(postcode, page)
+    if page == 1:
+        return PAGE_TMPL.format(state="standin", tbl=tblAttr, rows="")
+    return None
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Answers LocalitySearchResults.aspx requests like the AEC does"""
+
+    def do_GET(self):
+        self.respond({})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        self.respond(parse_qs(body))
+
+    def respond(self, form):
+        stats["requests"] += 1
+        if latency or jitter:
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter))
+                       / 1000.0)
+        if errorrate and random.random() < errorrate:
+            stats["injected"] += 1
+            return self.send_error(500, "Injected error")
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if not url.path.endswith("LocalitySearchResults.aspx") or \
+           "filter" not in query:
+            stats["errors"] += 1
+            return self.send_error(404)
+
+        page = 1
+        arg = form.get("__EVENTARGUMENT", [""])[0]
+        if arg:
+            pagenum = re.match(r"Page\$([0-9]+)$", arg)
+            if not pagenum or "__VIEWSTATE" not in form:
+                stats["errors"] += 1
+                return self.send_error(400, "Invalid postback")
+            page = int(pagenum.group(1))
+
+        text = findPage(query["filter"][0], page)
+        if text is None:
+            stats["errors"] += 1
+            return self.send_error(404)
+        data = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        # Per-request logging would swamp any benchmark run
+        pass
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "d:e:g:hj:l:p:")
+    dopts = dict(opts)
+
+    if "-h" in dopts:
+        usage()
+        sys.exit(0)
+
+    recdir = dopts.get("-d", recdir)
+    synthrows = int(dopts.get("-g", synthrows))
+    latency = float(dopts.get("-l", latency))
+    jitter = float(dopts.get("-j", jitter))
+    errorrate = float(dopts.get("-e", errorrate))
+    port = int(dopts.get("-p", 8080))
+
+    server = ThreadingHTTPServer(("localhost", port), StandinHandler)
+    print("Serving LocalitySearchResults.aspx on http://localhost:{0}/ "
+          "from {1}".format(port, recdir))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("\n{requests} requests, {errors} errors, {injected} "
+          "injected errors".format(**stats))
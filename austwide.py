@@ -33,6 +33,9 @@ import sys
 
 from bs4 import BeautifulSoup
 
+from manifest import writeManifest
+from shpfile import iterShapes
+
 
 __doc__ = """
 This script extracts state and territory names and polygon points
@@ -43,7 +46,8 @@ State and Territory ASGC Ed 2011 Digital Boundaries in MapInfo
 https://www.abs.gov.au/ausstats/subscriber.nsf/log?openagent&1259030001_ste11aaust_midmif.zip&1259.0.30.001&Data%20Cubes&6E45E3029A27FFEFCA2578CC0012083E&0&July%202011&14.07.2011&Latest
 
 
-then writes that data to local (same directory) JSON files.
+then writes that data to local (same directory) JSON files, each with
+a manifest (see manifest.py) alongside.
 """
 
 usagestr = """
@@ -51,6 +55,8 @@ usagestr = """
 austwide.py filename
 
     filename is the KML file to read the state/territory boundaries from.
+    If it ends in .shp, it's read directly as the ABS' shapefile (with
+    its .shx and .dbf alongside), with no need for ogr2ogr.
 
 """
 
@@ -71,33 +77,63 @@ areas = {
 # somewhat more special case - and I'm not really worried about much
 # in the way of error handling. Quick-n-dirty.
 
-kmlf = open(sys.argv[1], "r")
-
-ksoup = BeautifulSoup(kmlf.read(), "xml")
-# Basic check #1
-ogrFC = ksoup.find("ogr:FeatureCollection")
-if not ogrFC.attrs:
-    print("{0} does not appear to be a valid GML file "
-          "(no attrs found)\n".format(kmlf.name))
-    sys.exit(1)
+# The shapefile attributes which might hold the state/territory name
+# (a .dbf field name stops at 10 characters)
+nameFields = ["STATE_NAME_2011", "STE_NAME11", "STATE_NAME"]
+
+
+def gmlPlaces(ksoup):
+    """
+    Yields (name, coords) for each state/territory in the ogr2ogr
+    converted soup ksoup.
+    """
+    for place in ksoup.findAll("gml:featureMember"):
+        terrname = place.find("ogr:STATE_NAME_2011").string
+        #
+        # Ensure that we strip off the altitude and any erroneous
+        # leading null elements before we add the record
+        llalt = []
+        for coo in place.findAll("gml:coordinates"):
+            llalt.extend(coo.string.split(" "))
+        # This mouthful ensures that we stores the floating point
+        # values for lat/long, rather than string forms. This makes
+        # consumers of this output much happier.
+        coords = [list(map(float, x.split(",")[0:2])) for x in
+                  llalt if len(x) > 1]
+        yield terrname, coords
+
+
+def shpPlaces(shpfn):
+    """
+    Yields (name, coords) for each state/territory in the shapefile
+    shpfn, with every ring in coords as for the GML.
+    """
+    for record, parts in iterShapes(shpfn):
+        terrname = [record[field] for field in nameFields
+                    if record.get(field)][0]
+        yield terrname, [pt for part in parts for pt in part]
+
+
+if sys.argv[1].endswith(".shp"):
+    places = shpPlaces(sys.argv[1])
+else:
+    kmlf = open(sys.argv[1], "r")
+
+    ksoup = BeautifulSoup(kmlf.read(), "xml")
+    kmlf.close()
+    # Basic check #1
+    ogrFC = ksoup.find("ogr:FeatureCollection")
+    if not ogrFC.attrs:
+        print("{0} does not appear to be a valid GML file "
+              "(no attrs found)\n".format(kmlf.name))
+        sys.exit(1)
+    places = gmlPlaces(ksoup)
 
 print("\n")
 print("{0:^30} {1:^18}".format("State/Territory", "Number of points"))
 print("{0:^30} {1:^18}".format("-"*30, "-"*18))
 
-for place in ksoup.findAll("gml:featureMember"):
-    terrname = place.find("ogr:STATE_NAME_2011").string
-    #
-    # Ensure that we strip off the altitude and any erroneous
-    # leading null elements before we add the record
-    llalt = []
-    for coo in place.findAll("gml:coordinates"):
-        llalt.extend(coo.string.split(" "))
-    # This mouthful ensures that we stores the floating point
-    # values for lat/long, rather than string forms. This makes
-    # consumers of this output much happier.
-    coords = [list(map(float, x.split(",")[0:2])) for x in
-              llalt if len(x) > 1]
+for terrname, coords in places:
     print("{0:30} {1:18}".format(terrname, len(coords)))
 
     outfn = areas[terrname] + ".json"
@@ -110,7 +146,6 @@ for place in ksoup.findAll("gml:featureMember"):
         }
     json.dump(terrdict, outf)
     outf.close()
+    writeManifest(outfn, {terrname: terrdict}, single=True)
 
 print("\n")
-
-kmlf.close()
@@ -33,10 +33,14 @@ import getopt
 import json
 import sys
 
-from pymongo import MongoClient
-
 from bs4 import BeautifulSoup
 
+from adjacency import adjacencyName, writeAdjacency
+from manifest import writeManifest
+from shpfile import iterShapes
+from tiles import tilesName, writeTiles
+from topo import topoName, writeTopology
+
 
 __doc__ = """
 This script extracts electorate names and polygon points from the
@@ -44,7 +48,8 @@ various state/territory Electoral Commission KML data (whether that's
 supplied as native KML, or I've run it through with ogr2ogr), then
 writes that data to a MongoDB instance **stored locally** as well as
 dumping it to a file in JSON format. The output filename is based
-on the date and time when the script is run.
+on the date and time when the script is run, and a per-electorate
+manifest (see manifest.py) is written alongside it.
 
 TODO: support checking against for previous database files.
 -- mitigation: MongoDB's "find_one_and_update"
@@ -61,10 +66,13 @@ TODO: add support for checking local government areas.
 
 usagestr = """
 
-electorates.py -f filename [-p prefix] -t state-or-territory
+electorates.py -f filename [-A] [-n] [-p prefix] [-T] [-Z zoom]
+               -t state-or-territory
 electorates.py -h
 
     filename is the KML file to read the electorate boundaries from.
+    If it ends in .shp, it's read directly as an ESRI shapefile (with
+    its .shx and .dbf alongside), with no need for ogr2ogr.
 
     state-or-territory is the name of an Australian state or territory
     with 'federal' to cover the whole country. Local government area
@@ -72,6 +80,18 @@ electorates.py -h
 
     prefix is optional, and if supplied is for the output filename.
 
+    -A also writes which electorates border each other, and the length
+    of each shared border (see adjacency.py), alongside the JSON file.
+
+    -n skips updating the MongoDB instance, and only writes the JSON
+    file (and its manifest). pymongo is not needed with -n.
+
+    -T also writes the electorates as a shared-arc topology (see topo.py)
+    alongside the JSON file, with .topo.json in place of .json.
+
+    -Z also shards the electorates into map tiles at zoom level zoom
+    (see tiles.py), in a directory named with .tiles in place of .json.
+
 """
 
 # Each electorate is 'Name' : points. We also stash the date and
@@ -130,8 +150,75 @@ def getName(where):
     return "Unable to find a supported Tag, please check the schema."
 
 
+# The shapefile attributes which getRecordName() checks, in the same
+# order as getName(). A .dbf field name stops at 10 characters.
+recordNames = ["name", "ELECTORATE", "DISTRICT_NAME", "DISTRICT_N",
+               "Elect_div", "Name", "NAME"]
+
+
+def getRecordName(record):
+    """
+    As getName(), but for the attribute record of a shapefile feature.
+    """
+    for field in recordNames:
+        if record.get(field):
+            return record[field]
+
+    return "Unable to find a supported field, please check the schema."
+
+
+def kmlPlaces(kmlf, terr):
+    """
+    Yields (name, state, coords) for each electorate in the KML (or
+    ogr2ogr-converted GML) file kmlf.
+    """
+    ksoup = BeautifulSoup(kmlf.read(), "xml")
+
+    # Is this KML (and if so, which sort?), or is it an ogr2ogr-converted
+    # mapinfo thing?
+    if ksoup.find("kml"):
+        placemark = "Placemark"
+        coordname = "coordinates"
+    else:
+        placemark = "gml:featureMember"
+        coordname = "gml:coordinates"
+
+    for place in ksoup.findAll(placemark):
+        ename = getName(place).title()
+        if terr == "federal":
+            tstate = place.find("ogr:State").string
+        else:
+            tstate = terr.upper()
+        #
+        # Ensure that we strip off the altitude and any erroneous
+        # leading null elements before we add the record
+        llalt = place.findAll(coordname)[0].string.split(" ")
+        #
+        # This mouthful ensures that we stores the floating point
+        # values for lat/long, rather than string forms. Trust me,
+        # it will make consumers of this db much happier.
+        coords = [list(map(float, x.split(",")[0:2])) for x in
+                  llalt if len(x) > 1]
+        yield ename, tstate, coords
+
+
+def shpPlaces(shpfn, terr):
+    """
+    Yields (name, state, coords) for each electorate in the shapefile
+    shpfn. As for KML, we only keep the first ring of each electorate.
+    """
+    for record, parts in iterShapes(shpfn):
+        ename = getRecordName(record).title()
+        if terr == "federal":
+            tstate = record["State"]
+        else:
+            tstate = terr.upper()
+        coords = parts[0] if parts else []
+        yield ename, tstate, coords
+
+
 if __name__ == "__main__":
-    opts, args = getopt.getopt(sys.argv[1:], "f:hp:t:")
+    opts, args = getopt.getopt(sys.argv[1:], "ATZ:f:hnp:t:")
     dopts = dict(opts)
 
     if "-h" in dopts or len(dopts) < 1:
@@ -164,49 +251,33 @@ if __name__ == "__main__":
     if "-p" not in dopts:
         outf = outprefix + ".json"
     else:
-        outf = opts["-p"] + "-" + outprefix + ".json"
+        outf = dopts["-p"] + "-" + outprefix + ".json"
 
     # Now we start the interesting bits
-    ksoup = BeautifulSoup(kmlf.read(), "xml")
-
-    # Is this KML (and if so, which sort?), or is it an ogr2ogr-converted
-    # mapinfo thing?
-    if ksoup.find("kml"):
-        placemark = "Placemark"
-        coordname = "coordinates"
+    if dopts["-f"].endswith(".shp"):
+        kmlf.close()
+        places = shpPlaces(dopts["-f"], terr)
     else:
-        placemark = "gml:featureMember"
-        coordname = "gml:coordinates"
+        places = kmlPlaces(kmlf, terr)
 
     # Now that we've got element names figured out, it's time to
     # extract some data and then add it to a MongoDB instance
-    client = MongoClient("mongodb://localhost/Electorates")
-    dbc = client.Electoratesdb.coll
+    dbc = None
+    if "-n" not in dopts:
+        from pymongo import MongoClient
+        client = MongoClient("mongodb://localhost/Electorates")
+        dbc = client.Electoratesdb.coll
 
-    for place in ksoup.findAll(placemark):
-        ename = getName(place).title()
-        if terr == "federal":
-            tstate = place.find("ogr:State").string
-        else:
-            tstate = terr.upper()
-        #
-        # Ensure that we strip off the altitude and any erroneous
-        # leading null elements before we add the record
-        llalt = place.findAll(coordname)[0].string.split(" ")
-        #
-        # This mouthful ensures that we stores the floating point
-        # values for lat/long, rather than string forms. Trust me,
-        # it will make consumers of this db much happier.
-        coords = [list(map(float, x.split(",")[0:2])) for x in
-                  llalt if len(x) > 1]
+    for ename, tstate, coords in places:
         #
         # This is effectively a cast to void, because we're not
         # *really* interested in any returned document. At this point,
         # at any rate.
-        dbc.find_one_and_update(
-            {"locality": ename, "jurisdiction": tstate},
-            {'$set': {"coords": coords}},
-            upsert=True)
+        if dbc is not None:
+            dbc.find_one_and_update(
+                {"locality": ename, "jurisdiction": tstate},
+                {'$set': {"coords": coords}},
+                upsert=True)
         electorates[ename] = {
             "locality": ename,
             "jurisdiction": tstate,
@@ -216,3 +287,10 @@ if __name__ == "__main__":
     with open(outf, "w") as outfile:
         outfile.write(json.dumps(electorates))
         outfile.close()
+    writeManifest(outf, electorates)
+    if "-A" in dopts:
+        writeAdjacency(adjacencyName(outf), electorates, sources=[outf])
+    if "-T" in dopts:
+        writeTopology(topoName(outf), electorates)
+    if "-Z" in dopts:
+        writeTiles(tilesName(outf), electorates, int(dopts["-Z"]))
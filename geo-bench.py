@@ -0,0 +1,186 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+__doc__ = """
+This script benchmarks SA1-to-mbpt.py, electorates.py and austwide.py
+against synthetic data from geo-synth.py, at several multiples of a
+base feature count, and reports for each run the wall time, features
+and vertices per second, and the peak RSS of the script's process.
+
+Everything happens in a scratch directory, which is removed afterwards
+unless one is given with -d. electorates.py is run with -n, so that no
+MongoDB instance is needed.
+"""
+
+usagestr = """
+
+USAGE
+-----
+
+geo-bench.py [-n features] [-v vertices] [-x scales] [-s scripts]
+             [-d directory]
+geo-bench.py -h
+
+    features is the base (1x) number of features, default 100.
+
+    vertices is roughly the number of points in each feature's
+    boundary, default 40.
+
+    scales is a comma-separated list of multiples of the base count to
+    run at, default 1,10,100.
+
+    scripts is a comma-separated list of which runs to do, from
+    sa1, electorates-gml, electorates-kml, electorates-shp, austwide,
+    sa1-shp and austwide-shp (default all). The -shp runs read
+    shapefiles directly rather than GML or KML.
+
+    directory is where to generate the data and run the scripts; it is
+    kept afterwards.
+
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name: (geo-synth.py arguments, script, script arguments)
+RUNS = [
+    ("sa1", ["-k", "sa1", "-o", "sa1"],
+     "SA1-to-mbpt.py", ["sa1.csv", "sa1.gml"]),
+    ("electorates-gml", ["-k", "electorates", "-s", "gml", "-o", "elgml"],
+     "electorates.py", ["-n", "-f", "elgml.gml", "-t", "federal"]),
+    ("electorates-kml", ["-k", "electorates", "-s", "kml", "-o", "elkml"],
+     "electorates.py", ["-n", "-f", "elkml.kml", "-t", "nsw"]),
+    ("electorates-shp", ["-k", "electorates", "-f", "shp", "-o", "elshp"],
+     "electorates.py", ["-n", "-f", "elshp.shp", "-t", "federal"]),
+    ("austwide", ["-k", "austwide", "-o", "aust"],
+     "austwide.py", ["aust.gml"]),
+    ("sa1-shp", ["-k", "sa1", "-f", "shp", "-o", "sa1"],
+     "SA1-to-mbpt.py", ["sa1.csv", "sa1.shp"]),
+    ("austwide-shp", ["-k", "austwide", "-f", "shp", "-o", "aust"],
+     "austwide.py", ["aust.shp"])
+]
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def runScript(script, args, workdir):
+    """
+    Runs script with args in workdir, and returns (seconds, peak RSS in
+    KiB, exit status). wait4() gives us the rusage of just this child.
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, script)] +
+                            args, cwd=workdir, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    _pid, status, rusage = os.wait4(proc.pid, 0)
+    if os.WIFEXITED(status):
+        proc.returncode = os.WEXITSTATUS(status)
+    else:
+        proc.returncode = -os.WTERMSIG(status)
+    elapsed = time.perf_counter() - start
+    return elapsed, rusage.ru_maxrss, proc.returncode
+
+
+def benchRun(name, synthargs, script, args, workdir, nfeatures, vertices):
+    """Generates the data for one run, then times the script over it"""
+    subprocess.run([sys.executable, os.path.join(HERE, "geo-synth.py"),
+                    "-n", str(nfeatures), "-v", str(vertices)] + synthargs,
+                   cwd=workdir, check=True, stdout=subprocess.DEVNULL)
+    insize = sum(os.path.getsize(os.path.join(workdir, fn))
+                 for fn in args if os.path.exists(os.path.join(workdir, fn)))
+    nvertices = nfeatures * (4 * max(1, vertices // 4) + 1)
+    elapsed, maxrss, status = runScript(script, args, workdir)
+    if status != 0:
+        print("{0:<16} {1:>8} failed with exit status {2}".format(
+            name, nfeatures, status))
+        return
+    print("{0:<16} {1:>8} {2:>10} {3:>8.1f} {4:>9.2f} {5:>10.1f} "
+          "{6:>11.1f} {7:>9.1f}".format(
+              name, nfeatures, nvertices, insize / 1048576.0, elapsed,
+              nfeatures / elapsed, nvertices / elapsed / 1000.0,
+              maxrss / 1024.0))
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "d:hn:s:v:x:")
+    dopts = dict(opts)
+
+    if "-h" in dopts:
+        usage()
+        sys.exit(0)
+
+    nfeatures = int(dopts.get("-n", 100))
+    vertices = int(dopts.get("-v", 40))
+    scales = [int(scale) for scale in dopts.get("-x", "1,10,100").split(",")]
+    wanted = [run[0] for run in RUNS]
+    if "-s" in dopts:
+        wanted = dopts["-s"].split(",")
+        unknown = set(wanted) - set(run[0] for run in RUNS)
+        if unknown:
+            print("Unknown scripts {0}. Please use values from {1}".format(
+                ", ".join(sorted(unknown)), [run[0] for run in RUNS]))
+            sys.exit(1)
+
+    workdir = dopts.get("-d")
+    if workdir is None:
+        scratch = tempfile.mkdtemp(prefix="geo-bench-")
+    else:
+        scratch = None
+        os.makedirs(workdir, exist_ok=True)
+
+    print("{0:<16} {1:>8} {2:>10} {3:>8} {4:>9} {5:>10} {6:>11} "
+          "{7:>9}".format("script", "features", "vertices", "in MiB",
+                          "seconds", "features/s", "kvertices/s",
+                          "RSS MiB"))
+    try:
+        for scale in scales:
+            for (name, synthargs, script, scriptargs) in RUNS:
+                if name not in wanted:
+                    continue
+                rundir = os.path.join(workdir or scratch,
+                                      "{0}-{1}x".format(name, scale))
+                os.makedirs(rundir, exist_ok=True)
+                benchRun(name, synthargs, script, scriptargs, rundir,
+                         nfeatures * scale, vertices)
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch)
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import struct
+import sys
+
+__doc__ = """
+This script generates synthetic boundary data in the shapes that
+SA1-to-mbpt.py, electorates.py and austwide.py read, so that they can
+be exercised and benchmarked without the (large, licence-bound) ABS
+and Electoral Commission downloads.
+
+Features are the cells of a grid laid over Australia. Every grid line
+is jittered, and neighbouring cells walk exactly the same points along
+their shared edge, just as real adjoining boundaries do. The output
+depends only on the arguments, so a given seed always produces the
+same files.
+"""
+
+usagestr = """
+
+USAGE
+-----
+
+geo-synth.py -k kind [-f format] [-n features] [-v vertices] [-s schema]
+             [-S seed] -o outprefix
+geo-synth.py -h
+
+    kind is one of
+
+        sa1          ogr2ogr-style GML of SA1 mesh blocks, written to
+                     outprefix.gml, plus the matching SED CSV in
+                     outprefix.csv, for SA1-to-mbpt.py
+        electorates  electorate boundaries for electorates.py, as native
+                     KML (outprefix.kml) or ogr2ogr-style GML
+                     (outprefix.gml) depending on the schema
+        austwide     ogr2ogr-style GML of the states and territories for
+                     austwide.py, each made of features/9 separate parts,
+                     written to outprefix.gml
+
+    format is gml (the default) or shp, for an ESRI shapefile of the
+    same features in outprefix.shp, .shx, .dbf and .cpg. (KML
+    electorates are always KML.)
+
+    features is the number of features (mesh blocks, electorates or
+    state parts) to generate, default 100.
+
+    vertices is roughly the number of points in each feature's
+    boundary, default 40.
+
+    schema picks how electorates are named, from the tag forms that
+    electorates.py's getName() understands:
+
+        name            KML <name>
+        ELECTORATE      KML <SimpleData name="ELECTORATE">
+        DISTRICT_NAME   KML <SimpleData name="DISTRICT_NAME">
+        kml             cycle through all three KML forms
+        Elect_div       GML <ogr:Elect_div>
+        Name            GML <ogr:Name>
+        NAME            GML <ogr:NAME>
+        ogrname         GML <ogr:name>
+        gml             cycle through all four GML forms (the default)
+
+    A shapefile names electorates with a single field: the schema's,
+    cut to the 10 characters a .dbf allows, or ELECTORATE for kml and
+    Elect_div for gml.
+
+    GML and shapefile electorates carry a State, so they suit
+    electorates.py's '-t federal'; KML electorates suit any single state.
+
+"""
+
+# Bounding box of the mainland, near enough: west, south, east, north
+BBOX = (113.0, -39.0, 153.5, -10.5)
+
+# Share of the SA1s which each jurisdiction gets, in alljuris order
+JURIS = [
+    ("New South Wales", "NSW", 30),
+    ("Victoria", "VIC", 25),
+    ("Queensland", "QLD", 20),
+    ("South Australia", "SA", 7),
+    ("Western Australia", "WA", 10),
+    ("Tasmania", "TAS", 4),
+    ("Northern Territory", "NT", 2),
+    ("Australian Capital Territory", "ACT", 2)
+]
+
+KMLSCHEMAS = ["name", "ELECTORATE", "DISTRICT_NAME"]
+GMLSCHEMAS = ["Elect_div", "Name", "NAME", "ogrname"]
+
+SYLLABLES = ("bar ben cal dar el gal hol kin lar mel mur nor ong "
+             "par qu ros tal wan yar").split()
+
+GMLHEAD = """<?xml version="1.0" encoding="utf-8" ?>
+<ogr:FeatureCollection
+     xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+     xsi:schemaLocation="http://ogr.maptools.org/ {name}.xsd"
+     xmlns:ogr="http://ogr.maptools.org/"
+     xmlns:gml="http://www.opengis.net/gml">
+  <gml:boundedBy>
+    <gml:Box>
+      <gml:coord><gml:X>{0}</gml:X><gml:Y>{1}</gml:Y></gml:coord>
+      <gml:coord><gml:X>{2}</gml:X><gml:Y>{3}</gml:Y></gml:coord>
+    </gml:Box>
+  </gml:boundedBy>
+"""
+
+GMLTAIL = "</ogr:FeatureCollection>\n"
+
+GMLPOLY = """<gml:Polygon srsName="EPSG:4283"><gml:outerBoundaryIs>\
+<gml:LinearRing><gml:coordinates>{0}</gml:coordinates></gml:LinearRing>\
+</gml:outerBoundaryIs></gml:Polygon>"""
+
+GMLFEATURE = """  <gml:featureMember>
+    <ogr:{layer} fid="{layer}.{fid}">
+      <ogr:geometryProperty>{geometry}</ogr:geometryProperty>
+{fields}
+    </ogr:{layer}>
+  </gml:featureMember>
+"""
+
+KMLHEAD = """<?xml version="1.0" encoding="utf-8" ?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document id="root_doc">
+<name>{name}</name>
+<Schema name="{name}" id="{name}">
+  <SimpleField name="ELECTORATE" type="string"></SimpleField>
+  <SimpleField name="DISTRICT_NAME" type="string"></SimpleField>
+</Schema>
+<Folder><name>{name}</name>
+"""
+
+KMLTAIL = "</Folder>\n</Document></kml>\n"
+
+KMLFEATURE = """  <Placemark>
+{name}    <Style><LineStyle><color>ff0000ff</color></LineStyle>\
+<PolyStyle><fill>0</fill></PolyStyle></Style>
+{data}    <Polygon><outerBoundaryIs><LinearRing><coordinates>{coords}\
+</coordinates></LinearRing></outerBoundaryIs></Polygon>
+  </Placemark>
+"""
+
+KMLDATA = """    <ExtendedData><SchemaData schemaUrl="#{layer}">
+      <SimpleData name="{field}">{value}</SimpleData>
+    </SchemaData></ExtendedData>
+"""
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+class Grid(object):
+    """
+    A jittered grid of cols x rows cells over BBOX, each side of a cell
+    being split into `per` segments. Jitter is a pure function of the
+    lattice point and the seed, so every cell sharing a point sees the
+    same coordinates for it, and no lattice needs to be kept.
+    """
+
+    def __init__(self, cells, vertices, seed):
+        self.per = max(1, vertices // 4)
+        self.cols = max(1, int((cells * 1.25) ** 0.5))
+        self.rows = (cells + self.cols - 1) // self.cols
+        self.seed = seed
+        self.dx = (BBOX[2] - BBOX[0]) / (self.cols * self.per)
+        self.dy = (BBOX[3] - BBOX[1]) / (self.rows * self.per)
+
+    def jitter(self, i, j, axis):
+        """A repeatable offset in [-0.25, 0.25) for a lattice point"""
+        h = (i * 73856093) ^ (j * 19349663) ^ (axis * 83492791) ^ self.seed
+        h = (h * 2654435761) & 0xffffffff
+        return (h >> 8) / float(1 << 24) - 0.5
+
+    def point(self, i, j):
+        """Returns lattice point (i, j) as (lon, lat), to 6 places"""
+        lon = BBOX[0] + (i + 0.5 * self.jitter(i, j, 0)) * self.dx
+        lat = BBOX[1] + (j + 0.5 * self.jitter(i, j, 1)) * self.dy
+        return (round(lon, 6), round(lat, 6))
+
+    def points(self, cell):
+        """
+        Returns the closed boundary of cell as a list of (lon, lat),
+        clockwise from its south-west corner as in a shapefile.
+        """
+        per = self.per
+        i0 = (cell % self.cols) * per
+        j0 = (cell // self.cols) * per
+        walk = [(i0, j0 + k) for k in range(per)]
+        walk += [(i0 + k, j0 + per) for k in range(per)]
+        walk += [(i0 + per, j0 + per - k) for k in range(per)]
+        walk += [(i0 + per - k, j0) for k in range(per)]
+        walk.append(walk[0])
+        return [self.point(i, j) for (i, j) in walk]
+
+    def ring(self, cell, suffix=""):
+        """Returns the boundary of cell as space-separated 'lon,lat'"""
+        return " ".join("{0:.6f},{1:.6f}{2}".format(lon, lat, suffix)
+                        for (lon, lat) in self.points(cell))
+
+
+def placeName(num):
+    """A made-up, unique, place name for num"""
+    parts = []
+    while True:
+        num, rem = divmod(num, len(SYLLABLES))
+        parts.append(SYLLABLES[rem])
+        if num == 0:
+            break
+    return "".join(parts).title()
+
+
+class GmlWriter(object):
+    """Writes features as ogr2ogr-style GML to outprefix.gml"""
+
+    def __init__(self, outprefix, layer, _fieldspecs):
+        self.outfn = outprefix + ".gml"
+        self.layer = layer
+        self.fid = 0
+        self.outf = open(self.outfn, "w")
+        self.outf.write(GMLHEAD.format(*BBOX, name=layer))
+
+    def add(self, fields, rings):
+        """
+        Writes one feature, with fields a list of (name, value) and
+        rings a list of lists of (lon, lat). Several rings make a
+        multipolygon.
+        """
+        polys = [GMLPOLY.format(" ".join("{0:.6f},{1:.6f}".format(lon, lat)
+                                         for (lon, lat) in ring))
+                 for ring in rings]
+        if len(polys) == 1:
+            geometry = polys[0]
+        else:
+            geometry = ("<gml:MultiPolygon srsName=\"EPSG:4283\">" +
+                        "".join("<gml:polygonMember>" + poly +
+                                "</gml:polygonMember>" for poly in polys) +
+                        "</gml:MultiPolygon>")
+        self.outf.write(GMLFEATURE.format(
+            layer=self.layer, fid=self.fid, geometry=geometry,
+            fields="\n".join("      <ogr:{0}>{1}</ogr:{0}>".format(
+                name, value) for (name, value) in fields)))
+        self.fid += 1
+
+    def close(self):
+        """Finishes the file, returning the list of files written"""
+        self.outf.write(GMLTAIL)
+        self.outf.close()
+        return [self.outfn]
+
+
+class ShapeWriter(object):
+    """
+    Writes features as an ESRI polygon shapefile: outprefix.shp, .shx,
+    .dbf and .cpg. fieldspecs is a list of (name, type, length) for the
+    .dbf, with type 'C' for text or 'N' for integers.
+    """
+
+    def __init__(self, outprefix, _layer, fieldspecs):
+        self.outprefix = outprefix
+        self.fieldspecs = fieldspecs
+        self.shpf = open(outprefix + ".shp", "wb")
+        self.shxf = open(outprefix + ".shx", "wb")
+        self.dbff = open(outprefix + ".dbf", "wb")
+        # Headers are rewritten once we know the sizes and bounds
+        self.shpf.write(bytes(100))
+        self.shxf.write(bytes(100))
+        self.dbff.write(self.dbfHeader(0))
+        self.count = 0
+        self.bbox = None
+
+    def dbfHeader(self, count):
+        nfields = len(self.fieldspecs)
+        header = struct.pack("<BBBBIHH20x", 3, 119, 1, 1, count,
+                             32 + 32 * nfields + 1,
+                             1 + sum(length for (_n, _t, length) in
+                                     self.fieldspecs))
+        for (name, ftype, length) in self.fieldspecs:
+            header += struct.pack("<11sc4xBB14x", name.encode("ascii"),
+                                  ftype.encode("ascii"), length, 0)
+        return header + b"\r"
+
+    def shpHeader(self, words):
+        bbox = self.bbox or (0.0, 0.0, 0.0, 0.0)
+        return (struct.pack(">i20xi", 9994, words) +
+                struct.pack("<ii4d32x", 1000, 5, *bbox))
+
+    def add(self, fields, rings):
+        """Writes one polygon feature, as for GmlWriter.add()"""
+        points = [pt for ring in rings for pt in ring]
+        lons = [pt[0] for pt in points]
+        lats = [pt[1] for pt in points]
+        bbox = (min(lons), min(lats), max(lons), max(lats))
+        if self.bbox is None:
+            self.bbox = bbox
+        else:
+            self.bbox = (min(self.bbox[0], bbox[0]),
+                         min(self.bbox[1], bbox[1]),
+                         max(self.bbox[2], bbox[2]),
+                         max(self.bbox[3], bbox[3]))
+        starts = [0]
+        for ring in rings[:-1]:
+            starts.append(starts[-1] + len(ring))
+        content = struct.pack("<i4dii", 5, *(bbox + (len(rings),
+                                                     len(points))))
+        content += struct.pack("<{0}i".format(len(starts)), *starts)
+        content += struct.pack("<{0}d".format(2 * len(points)),
+                               *[v for pt in points for v in pt])
+
+        self.count += 1
+        offset = self.shpf.tell()
+        self.shpf.write(struct.pack(">ii", self.count, len(content) // 2))
+        self.shpf.write(content)
+        self.shxf.write(struct.pack(">ii", offset // 2, len(content) // 2))
+
+        values = dict(fields)
+        record = b" "
+        for (name, ftype, length) in self.fieldspecs:
+            value = str(values.get(name, "")).encode("utf-8")[:length]
+            if ftype == "N":
+                record += value.rjust(length)
+            else:
+                record += value.ljust(length)
+        self.dbff.write(record)
+
+    def close(self):
+        """Finishes the files, returning the list of files written"""
+        self.dbff.write(b"\x1a")
+        for (outf, header) in ((self.shpf, self.shpHeader),
+                               (self.shxf, self.shpHeader),
+                               (self.dbff, self.dbfHeader)):
+            if header == self.dbfHeader:
+                size = self.count
+            else:
+                size = outf.tell() // 2
+            outf.seek(0)
+            outf.write(header(size))
+            outf.close()
+        with open(self.outprefix + ".cpg", "w") as cpgf:
+            cpgf.write("UTF-8\n")
+        return [self.outprefix + ext for ext in (".shp", ".shx", ".dbf")]
+
+
+WRITERS = {"gml": GmlWriter, "shp": ShapeWriter}
+
+
+def writeSA1(outprefix, grid, nfeatures, fmt):
+    """
+    Writes the SA1 geometry and the SED CSV. Jurisdictions get contiguous
+    runs of cells, and each jurisdiction is split into electoral
+    divisions of about 20 SA1s. A few SA1s go to the Other Territories
+    and to the "No usual address" divisions, which SA1-to-mbpt.py skips.
+    """
+    weights = sum(share for (_name, _abbr, share) in JURIS)
+    csvf = open(outprefix + ".csv", "w")
+    csvf.write("SA1_MAINCODE_2016,SED_CODE_2016,SED_NAME_2016,"
+               "STATE_CODE_2016,STATE_NAME_2016,AREA_ALBERS_SQKM\n")
+    writer = WRITERS[fmt](outprefix, "SA1_2016_AUST",
+                          [("SA1_MAIN16", "C", 11), ("STE_NAME16", "C", 50)])
+
+    cell = 0
+    sedno = 0
+    for (jnum, (juris, abbr, share)) in enumerate(JURIS):
+        count = max(2, nfeatures * share // weights)
+        if jnum == len(JURIS) - 1:
+            count = max(2, nfeatures - cell)
+        for k in range(count):
+            sa1 = "{0}{1:010d}".format(jnum + 1, cell)
+            sed = "{0} ({1})".format(placeName(sedno + k // 20), abbr)
+            if k == count - 1:
+                sed = "No usual address ({0})".format(abbr)
+            csvf.write("{0},{1},{2},{3},{4},{5:.4f}\n".format(
+                sa1, jnum * 100 + k // 20, sed, jnum + 1, juris,
+                grid.dx * grid.dy * grid.per * grid.per * 9000))
+            writer.add([("SA1_MAIN16", sa1), ("STE_NAME16", juris)],
+                       [grid.points(cell)])
+            cell += 1
+        sedno += count // 20 + 1
+
+    # One SA1 in the Other Territories, which we don't bother drawing
+    sa1 = "9{0:010d}".format(cell)
+    csvf.write("{0},{1},{2},{3},{4},{5:.4f}\n".format(
+        sa1, 900, "Jervis Bay", 9, "Other Territories", 1.0))
+    csvf.close()
+    return [outprefix + ".csv"] + writer.close(), cell
+
+
+def stateOf(num, nfeatures):
+    """Returns the abbreviation of the jurisdiction of electorate num"""
+    weights = sum(share for (_name, _abbr, share) in JURIS)
+    upto = 0
+    for (_juris, abbr, share) in JURIS:
+        upto += share
+        if num * weights < upto * nfeatures:
+            return abbr
+    return JURIS[-1][1]
+
+
+def writeElectorates(outprefix, grid, nfeatures, schema, fmt):
+    """
+    Writes the electorates as KML, GML or a shapefile, depending on
+    schema and fmt. With 'kml' or 'gml', features cycle through that
+    format's name forms. A shapefile has a single name field.
+    """
+    if schema == "kml":
+        forms = KMLSCHEMAS
+    elif schema == "gml":
+        forms = GMLSCHEMAS
+    else:
+        forms = [schema]
+
+    if fmt == "shp":
+        # .dbf field names stop at 10 characters
+        field = {"kml": "ELECTORATE", "gml": "Elect_div",
+                 "ogrname": "name"}.get(schema, schema)[:10]
+        writer = ShapeWriter(outprefix, "Electorates",
+                             [(field, "C", 40), ("State", "C", 3)])
+        for num in range(nfeatures):
+            writer.add([(field, placeName(num)),
+                        ("State", stateOf(num, nfeatures))],
+                       [grid.points(num)])
+        return writer.close(), nfeatures
+
+    if forms[0] not in KMLSCHEMAS:
+        writer = GmlWriter(outprefix, "Electorates", None)
+        for num in range(nfeatures):
+            form = forms[num % len(forms)]
+            tag = "name" if form == "ogrname" else form
+            writer.add([(tag, placeName(num)),
+                        ("State", stateOf(num, nfeatures))],
+                       [grid.points(num)])
+        return writer.close(), nfeatures
+
+    outfn = outprefix + ".kml"
+    outf = open(outfn, "w")
+    outf.write(KMLHEAD.format(name="Electorates"))
+    for num in range(nfeatures):
+        form = forms[num % len(forms)]
+        ename = placeName(num)
+        name = ""
+        data = ""
+        if form == "name":
+            name = "    <name>{0}</name>\n".format(ename)
+        else:
+            data = KMLDATA.format(layer="Electorates", field=form,
+                                  value=ename.upper())
+        outf.write(KMLFEATURE.format(
+            name=name, data=data, coords=grid.ring(num, ",0")))
+    outf.write(KMLTAIL)
+    outf.close()
+    return [outfn], nfeatures
+
+
+def writeAustwide(outprefix, grid, nfeatures, fmt):
+    """
+    Writes the states and territories as one feature each, made of
+    every ninth cell, so each feature is a multipolygon.
+    """
+    states = [juris for (juris, _abbr, _share) in JURIS]
+    states.append("Other Territories")
+    writer = WRITERS[fmt](outprefix, "STE11aAust",
+                          [("STATE_CODE", "N", 1),
+                           ("STATE_NAME", "C", 50)])
+    # ogr2ogr keeps the long names which a .dbf can't hold
+    names = ("STATE_CODE", "STATE_NAME")
+    if fmt == "gml":
+        names = ("STATE_CODE_2011", "STATE_NAME_2011")
+    for (num, state) in enumerate(states):
+        writer.add([(names[0], num + 1), (names[1], state)],
+                   [grid.points(cell)
+                    for cell in range(num, nfeatures, len(states))])
+    return writer.close(), len(states)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "S:f:hk:n:o:s:v:")
+    dopts = dict(opts)
+
+    if "-h" in dopts or len(dopts) < 1:
+        usage()
+        sys.exit(0)
+
+    kind = dopts.get("-k")
+    if kind not in ("sa1", "electorates", "austwide"):
+        print("A kind of sa1, electorates or austwide must be specified")
+        sys.exit(1)
+
+    if "-o" not in dopts:
+        print("An output prefix must be specified")
+        sys.exit(1)
+
+    schema = dopts.get("-s", "gml")
+    if schema not in KMLSCHEMAS + GMLSCHEMAS + ["kml", "gml"]:
+        print("Invalid schema specified. Please use a value "
+              "from {0}, {1}, kml or gml".format(KMLSCHEMAS, GMLSCHEMAS))
+        sys.exit(1)
+
+    fmt = dopts.get("-f", "gml")
+    if fmt not in WRITERS:
+        print("Invalid format specified. Please use gml or shp")
+        sys.exit(1)
+
+    nfeatures = max(len(JURIS) + 1, int(dopts.get("-n", 100)))
+    grid = Grid(nfeatures, int(dopts.get("-v", 40)),
+                int(dopts.get("-S", 1)))
+
+    if kind == "sa1":
+        written, count = writeSA1(dopts["-o"], grid, nfeatures, fmt)
+    elif kind == "electorates":
+        written, count = writeElectorates(dopts["-o"], grid, nfeatures,
+                                          schema, fmt)
+    else:
+        written, count = writeAustwide(dopts["-o"], grid, nfeatures, fmt)
+
+    print("{0} features, {1} vertices per ring, written to {2}".format(
+        count, 4 * grid.per + 1, ", ".join(written)))
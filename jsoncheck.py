@@ -28,9 +28,17 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import getopt
 import json
+import os
+import re
 import sys
 
+from concurrent.futures import ProcessPoolExecutor
+
+from manifest import readManifest
+from topo import SUFFIX as TOPOSUFFIX, asElectorates
+
 __doc__ = """
 
 A simple (quick-n-dirty) script to compare the JSON contents of
@@ -44,60 +52,649 @@ we know that there are only four parts to check:
 -- "locality"
 -- "coords"
 
+With -s the files are compared in streaming mode: rather than loading
+both documents in full, we decode them one electorate at a time, so
+memory use is bounded by the largest electorate (plus any electorates
+which appear in a different order in the two files).
+
+With -g we compare the geometry properly, rather than just the first
+point: every vertex on each side is matched against the other side
+within a tolerance of epsilon (-e, in degrees), and we report the number
+of missing, extra and moved vertices along with the largest displacement
+of a moved vertex. A vertex counts as moved if its nearest unmatched
+partner on the other side is within the move radius (-m), otherwise it
+is missing or extra. Electorates are compared in parallel across -j
+worker processes. This mode requires NumPy.
+
+If both files have an up-to-date manifest (see manifest.py) we compare
+those first, and only read the coordinates of electorates whose digests
+differ from the files themselves. Use -M to ignore the manifests.
+
+With -d the two arguments are output directories rather than files.
+The .json files in each are paired up by name (ignoring the date-time
+prefix that electorates.py adds, so a directory holding more than one
+run leaves those files unpaired), compared concurrently across -j worker
+processes using whichever of the modes above were requested, and a JSON
+report of every difference found is written to -o (default stdout).
+The exit status is 0 if everything matched, 1 if there were any
+differences or unpaired files, and 2 if a comparison failed outright.
+
 """
 
+usagestr = """
 
-if __name__ == "__main__":
+jsoncheck.py [-M] [-s] [-g [-e epsilon] [-m radius]] [-j workers]
+             left.json right.json
+jsoncheck.py -d [-o report.json] [-M] [-s] [-g [-e epsilon] [-m radius]]
+             [-j workers] leftdir rightdir
 
-    if len(sys.argv) < 3:
-        print("Two arguments are required")
-        sys.exit(1)
+"""
+
+# How much of each file to read at a time in streaming mode
+chunkSize = 1 << 20
+
+# Geometry mode settings, see usage
+geomMode = False
+epsilon = 1e-7
+moveRadius = 1e-3
+workers = None
+geomPool = None
+# Output waiting on geometry results, in order: (message, None, None)
+# for what say() held back, (None, electorate, job) for a comparison.
+geomJobs = []
+geomPending = 0
+draining = False
+
+# How many (left, right) candidate pairs geomDiff measures at a time
+pairChunk = 1 << 20
+
+# Differences found in the pair of files being compared, see note().
+# In directory mode we collect these quietly from each worker.
+findings = []
+quiet = False
+
+# Strips electorates.py's [prefix-]YYYYmmdd-HHMM- from output filenames
+datedRE = re.compile(r"^(.*-)?[0-9]{8}-[0-9]{4}-")
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def iterElectorates(jsonf):
+    """
+    Generator which yields (name, details) for each member of the
+    top-level JSON object in jsonf, decoding one member at a time.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill(need):
+        """Reads at least need more characters, if there are any"""
+        nonlocal buf, pos, eof
+        buf = buf[pos:]
+        pos = 0
+        while not eof and need > 0:
+            chunk = jsonf.read(max(chunkSize, need))
+            if not chunk:
+                eof = True
+            need -= len(chunk)
+            buf += chunk
+
+    def skipws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill(chunkSize)
+
+    def expect(chars):
+        """Consumes and returns the next char, which must be in chars"""
+        nonlocal pos
+        skipws()
+        if pos >= len(buf) or buf[pos] not in chars:
+            raise ValueError("{0}: expected one of {1!r} at offset "
+                             "{2}".format(jsonf.name, chars, pos))
+        pos += 1
+        return buf[pos - 1]
+
+    def decode():
+        """Decodes the next complete value, reading more as required"""
+        nonlocal pos
+        skipws()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A number could continue into the next chunk
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # Grow geometrically so large values don't go quadratic
+            fill(max(chunkSize, len(buf) - pos))
+
+    expect("{")
+    skipws()
+    if pos < len(buf) and buf[pos] == "}":
+        return
+    while True:
+        name = decode()
+        expect(":")
+        yield name, decode()
+        if expect(",}") == "}":
+            return
+
+
+def iterAreas(jsonf):
+    """
+    Like iterElectorates, but a single-area document (as austwide.py
+    writes) comes out as its one (jurisdiction, details) pair. We can
+    tell from the first member: an electorate's details are an object,
+    and none of an area's members are.
+    """
+    members = iterElectorates(jsonf)
+    for name, details in members:
+        if isinstance(details, dict):
+            yield name, details
+            yield from members
+            return
+        doc = {name: details}
+        doc.update(members)
+        yield doc["jurisdiction"], doc
+        return
+
+
+def say(message):
+    """
+    Prints an informational message, unless we're being quiet. While
+    geometry comparisons are outstanding the message is queued behind
+    them, so that everything comes out in electorate order.
+    """
+    if quiet:
+        return
+    if geomJobs and not draining:
+        geomJobs.append((message, None, None))
+    else:
+        print(message)
+
+
+def note(kind, message, **details):
+    """Records a difference of the given kind, and says what it was"""
+    details["kind"] = kind
+    findings.append(details)
+    say(message)
+
+
+def noteExtra(leftn, extras):
+    """Records the electorates which are only in the right-hand file"""
+    for electorate in sorted(extras):
+        note("extra", "Electorate {electorate} is not in {left}, "
+             "skipping".format(electorate=electorate, left=leftn),
+             electorate=electorate)
+
+
+def vertexKeys(coords, eps):
+    """
+    Returns the distinct vertices of coords snapped to an eps grid, as
+    an (n, 2) int64 array.
+    """
+    import numpy as np
+
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    return np.unique(np.round(pts / eps).astype(np.int64), axis=0)
+
+
+def geomDiff(lcoords, rcoords, eps, radius):
+    """
+    Matches the vertices of lcoords against rcoords. Returns a dict of
+    the missing (left only), extra (right only) and moved vertex counts,
+    and the maximum displacement (degrees) of the moved vertices.
+    """
+    import numpy as np
+
+    lkeys = vertexKeys(lcoords, eps)
+    rkeys = vertexKeys(rcoords, eps)
+    # Exact matches on the snapped grid, compared as 16-byte blobs
+    rowtype = np.dtype((np.void, lkeys.dtype.itemsize * 2))
+    lrows = np.ascontiguousarray(lkeys).view(rowtype).ravel()
+    rrows = np.ascontiguousarray(rkeys).view(rowtype).ravel()
+    lonly = lkeys[~np.isin(lrows, rrows)] * eps
+    ronly = rkeys[~np.isin(rrows, lrows)] * eps
+
+    # With the right-only vertices sorted by longitude, the candidates
+    # for each left-only vertex are the run within radius of its own
+    # longitude. We measure those (left, right) pairs in chunks of about
+    # pairChunk, and keep each left-only vertex's nearest within radius.
+    order = np.argsort(ronly[:, 0], kind="stable")
+    rsorted = ronly[order]
+    lo = np.searchsorted(rsorted[:, 0], lonly[:, 0] - radius, "left")
+    hi = np.searchsorted(rsorted[:, 0], lonly[:, 0] + radius, "right")
+    counts = hi - lo
+    ends = np.cumsum(counts)
+    chose = np.full(len(lonly), -1, dtype=np.int64)
+    chosen = np.full(len(lonly), np.inf)
+    start = 0
+    while start < len(lonly):
+        done = ends[start - 1] if start else 0
+        stop = max(start + 1, int(np.searchsorted(ends, done + pairChunk,
+                                                  "right")))
+        cnt = counts[start:stop]
+        lidx = np.repeat(np.arange(start, stop), cnt)
+        ridx = lo[lidx] + np.arange(len(lidx)) - np.repeat(
+            np.cumsum(cnt) - cnt, cnt)
+        dists = np.hypot(*(rsorted[ridx] - lonly[lidx]).T)
+        near = dists <= radius
+        lidx, ridx, dists = lidx[near], ridx[near], dists[near]
+        # Nearest first within each left-only vertex, then take the first
+        byclose = np.lexsort((dists, lidx))
+        lidx, ridx, dists = lidx[byclose], ridx[byclose], dists[byclose]
+        first = np.ones(len(lidx), dtype=bool)
+        first[1:] = lidx[1:] != lidx[:-1]
+        chose[lidx[first]] = order[ridx[first]]
+        chosen[lidx[first]] = dists[first]
+        start = stop
+
+    # Each right-only vertex pairs with the closest left-only vertex
+    # that chose it; pairs closer than eps straddled a grid line and
+    # are really matches.
+    claims = np.full(len(ronly), np.inf)
+    picked = chose >= 0
+    np.minimum.at(claims, chose[picked], chosen[picked])
+    claimed = claims[np.isfinite(claims)]
+    matched = int(np.count_nonzero(claimed <= eps))
+    movedby = claimed[claimed > eps]
+    moved = len(movedby)
+    return {
+        "missing": len(lonly) - moved - matched,
+        "extra": len(ronly) - moved - matched,
+        "moved": moved,
+        "maxdisp": float(movedby.max()) if moved else 0.0
+    }
+
+
+def reportGeometry(electorate, res):
+    """Reports the result of geomDiff for electorate"""
+    if res["missing"] or res["extra"] or res["moved"]:
+        note("geometry", "Electorate of {electorate} has geometry "
+             "differences: {missing} missing, {extra} extra, {moved} moved "
+             "vertices, max displacement {maxdisp:.3g}".format(
+                 electorate=electorate, **res),
+             electorate=electorate, **res)
+    else:
+        say("Electorate of {electorate} has matching geometry".format(
+            electorate=electorate))
+
+
+def drainGeometry(keep):
+    """
+    Prints queued output, in order, until only keep geometry comparisons
+    remain outstanding.
+    """
+    global draining, geomPending
+    draining = True
+    try:
+        while geomJobs and (geomPending > keep or
+                            geomJobs[0][2] is None):
+            message, electorate, job = geomJobs.pop(0)
+            if job is None:
+                print(message)
+                continue
+            geomPending -= 1
+            reportGeometry(electorate, job.result())
+    finally:
+        draining = False
 
-    leftf = open(sys.argv[1], "r")
-    rightf = open(sys.argv[2], "r")
 
-    ljson = json.load(leftf)
-    rjson = json.load(rightf)
+def compareElectorate(electorate, lefte, righte):
+    """Reports the differences between the two versions of electorate"""
+    compareAttrs(electorate, lefte, righte)
+    compareCoords(electorate, lefte, righte)
+
+
+def compareAttrs(electorate, lefte, righte):
+    """Checks the jurisdiction and locality of electorate"""
+    #
+    # If the jurisdictions don't match then our inputs are
+    # just plain wrong
+    ljur = lefte["jurisdiction"]
+    rjur = righte["jurisdiction"]
+    if ljur != rjur:
+        note("jurisdiction", "Jurisdictions do NOT match ({left} vs "
+             "{right}) for electorate {electorate}".format(
+                 left=ljur, right=rjur, electorate=electorate),
+             electorate=electorate, left=ljur, right=rjur)
+
+    # austwide.py's areas don't have one
+    lloc = lefte.get("locality")
+    rloc = righte.get("locality")
+    if lloc != rloc:
+        note("locality", "Localities do NOT match ({left} vs "
+             "{right})".format(left=lloc, right=rloc),
+             electorate=electorate, left=lloc, right=rloc)
+
+
+def compareCoords(electorate, lefte, righte):
+    """Checks the coordinates of electorate"""
+    global geomPending
+    if geomMode and geomPool is None:
+        reportGeometry(electorate, geomDiff(
+            lefte["coords"], righte["coords"], epsilon, moveRadius))
+        return
+    if geomMode:
+        geomJobs.append((None, electorate, geomPool.submit(
+            geomDiff, lefte["coords"], righte["coords"], epsilon,
+            moveRadius)))
+        geomPending += 1
+        # Don't let the queue of pickled coordinates grow without bound
+        drainGeometry(4 * workers)
+        return
+
+    # Have we missed any coordinate points?
+    lcset = set(lefte["coords"][0])
+    rcset = set(righte["coords"][0])
+    diffset = lcset - rcset
+    message = "Electorate of {electorate} has coordinate differences: " \
+        "{diffset} ".format(diffset=diffset, electorate=electorate)
+    if diffset:
+        note("coords", message, electorate=electorate,
+             missing=sorted(diffset))
+    else:
+        say(message)
+
+
+def compareFiles(leftn, rightn):
+    """The original compare-in-memory mode"""
+    with open(leftn, "r") as leftf:
+        ljson = asElectorates(json.load(leftf))
+    with open(rightn, "r") as rightf:
+        rjson = asElectorates(json.load(rightf))
 
     lkset = set(ljson.keys())
     rkset = set(rjson.keys())
     diffset = lkset - rkset
 
-    print("checking keys: left {left} vs right {right}".format(
+    say("checking keys: left {left} vs right {right}".format(
         left=len(lkset), right=len(rkset)))
-    print("difference: {diffset}".format(diffset=diffset))
+    say("difference: {diffset}".format(diffset=diffset))
 
-    print("checking each electorate's details")
+    say("checking each electorate's details")
 
     for electorate in ljson.keys():
         if electorate not in rjson:
-            print("Electorate {electorate} is not in {right}, "
-                  "skipping".format(electorate=electorate,
-                                    right=sys.argv[2]))
+            note("missing", "Electorate {electorate} is not in {right}, "
+                 "skipping".format(electorate=electorate, right=rightn),
+                 electorate=electorate)
+            continue
+        compareElectorate(electorate, ljson[electorate], rjson[electorate])
+    noteExtra(leftn, rkset - lkset)
+
+
+def manifestDetails(fname, manifest, wanted):
+    """
+    Reads the details of the wanted electorates from fname. A single-area
+    file holds its one area's details at the top level, so we look
+    through to those. Raises ValueError if the electorates in fname
+    aren't the ones its manifest lists.
+    """
+    mkset = set(manifest["electorates"])
+    with open(fname, "r") as jsonf:
+        if manifest.get("single"):
+            details = json.load(jsonf)
+            fkset = {details.get("jurisdiction")}
+            found = {name: details for name in mkset}
+        else:
+            fkset = set()
+            found = {}
+            for name, details in iterElectorates(jsonf):
+                fkset.add(name)
+                if name in wanted:
+                    found[name] = details
+    if fkset != mkset:
+        raise ValueError("{0}: electorates {1} don't match its manifest "
+                         "{2}".format(fname, sorted(fkset), sorted(mkset)))
+    return found
+
+
+def manifestFiles(leftn, rightn, lmanifest, rmanifest):
+    """
+    Compares two files by their manifests. Only the electorates whose
+    coordinate digests differ are read from the files themselves, and
+    the files aren't opened at all if there are none.
+    """
+    lman = lmanifest["electorates"]
+    rman = rmanifest["electorates"]
+    lkset = set(lman.keys())
+    rkset = set(rman.keys())
+    diffset = lkset - rkset
+
+    say("checking keys: left {left} vs right {right}".format(
+        left=len(lkset), right=len(rkset)))
+    say("difference: {diffset}".format(diffset=diffset))
+
+    say("checking each electorate's details")
+
+    changed = []
+    for electorate in lman:
+        if electorate not in rman:
+            note("missing", "Electorate {electorate} is not in {right}, "
+                 "skipping".format(electorate=electorate, right=rightn),
+                 electorate=electorate)
             continue
+        compareAttrs(electorate, lman[electorate], rman[electorate])
+        if lman[electorate]["coords"] != rman[electorate]["coords"]:
+            changed.append(electorate)
+    noteExtra(leftn, rkset - lkset)
+    say("{same} electorates have identical coordinates (by "
+        "manifest)".format(same=len(lkset & rkset) - len(changed)))
+    if not changed:
+        return
+
+    wanted = set(changed)
+    ldetails = manifestDetails(leftn, lmanifest, wanted)
+    rdetails = manifestDetails(rightn, rmanifest, wanted)
+    for electorate in changed:
+        compareCoords(electorate, ldetails[electorate],
+                      rdetails[electorate])
+
+
+def streamFiles(leftn, rightn):
+    """
+    Walks both files in step. Electorates which turn up out of order are
+    held until their partner arrives; whatever is still held at the end
+    exists on one side only.
+    """
+    say("checking each electorate's details")
+    lpending = {}
+    rpending = {}
+    lcount = rcount = 0
+    with open(leftn, "r") as leftf, open(rightn, "r") as rightf:
+        liter = iterAreas(leftf)
+        riter = iterAreas(rightf)
+        while liter or riter:
+            for side in (liter, riter):
+                if side is None:
+                    continue
+                try:
+                    name, details = next(side)
+                except StopIteration:
+                    if side is liter:
+                        liter = None
+                    else:
+                        riter = None
+                    continue
+                if side is liter:
+                    lcount += 1
+                    mine, theirs = lpending, rpending
+                else:
+                    rcount += 1
+                    mine, theirs = rpending, lpending
+                if name in theirs:
+                    other = theirs.pop(name)
+                    if side is liter:
+                        compareElectorate(name, details, other)
+                    else:
+                        compareElectorate(name, other, details)
+                else:
+                    mine[name] = details
+
+    for electorate in lpending:
+        note("missing", "Electorate {electorate} is not in {right}, "
+             "skipping".format(electorate=electorate, right=rightn),
+             electorate=electorate)
+    noteExtra(leftn, rpending)
+    say("checking keys: left {left} vs right {right}".format(
+        left=lcount, right=rcount))
+    say("difference: {diffset}".format(diffset=set(lpending)))
+
+
+def comparePair(leftn, rightn, stream, manifests):
+    """Compares two files, using the manifests if we can"""
+    lman = rman = None
+    if manifests:
+        lman = readManifest(leftn)
+        rman = readManifest(rightn)
+
+    if lman is not None and rman is not None:
+        manifestFiles(leftn, rightn, lman, rman)
+    elif stream:
+        streamFiles(leftn, rightn)
+    else:
+        compareFiles(leftn, rightn)
+
+
+def checkPair(leftn, rightn, settings):
+    """
+    Directory mode worker: quietly compares one pair of files and returns
+    what was found. Geometry diffs run inline here, since the pairs are
+    already spread across processes.
+    """
+    global quiet, geomMode, epsilon, moveRadius
+    quiet = True
+    geomMode = settings["geom"]
+    epsilon = settings["epsilon"]
+    moveRadius = settings["moveRadius"]
+    del findings[:]
+    comparePair(leftn, rightn, settings["stream"], settings["manifests"])
+    return list(findings)
+
+
+def pairFiles(leftdir, rightdir):
+    """
+    Pairs up the .json files in leftdir and rightdir by name, leaving
+    out any topologies written alongside them. Returns the list of
+    (left, right) paths, and the unpaired names from each side. A name
+    which more than one file in a directory reduces to (two runs, or
+    two prefixes) can't be paired, so all of its files are unpaired.
+    """
+    def bykey(dirname):
+        files = {}
+        for fname in sorted(os.listdir(dirname)):
+            if fname.endswith(".json") and not fname.endswith(TOPOSUFFIX):
+                files.setdefault(datedRE.sub("", fname), []).append(fname)
+        return files
+
+    lfiles = bykey(leftdir)
+    rfiles = bykey(rightdir)
+    paired = set(key for key in lfiles if key in rfiles and
+                 len(lfiles[key]) == 1 and len(rfiles[key]) == 1)
+    pairs = [(os.path.join(leftdir, lfiles[key][0]),
+              os.path.join(rightdir, rfiles[key][0]))
+             for key in sorted(paired)]
+    lonly = [fname for key in sorted(lfiles) if key not in paired
+             for fname in lfiles[key]]
+    ronly = [fname for key in sorted(rfiles) if key not in paired
+             for fname in rfiles[key]]
+    return pairs, lonly, ronly
+
+
+def compareDirs(leftdir, rightdir, settings, nworkers):
+    """
+    Compares every pair of files from leftdir and rightdir concurrently.
+    Returns the report dict and the exit status it merits.
+    """
+    pairs, lonly, ronly = pairFiles(leftdir, rightdir)
+    report = {
+        "left": leftdir,
+        "right": rightdir,
+        "settings": settings,
+        "unpaired": {"left": lonly, "right": ronly},
+        "pairs": [],
+        "differences": 0,
+        "errors": 0
+    }
+    with ProcessPoolExecutor(max_workers=nworkers) as pool:
+        jobs = [pool.submit(checkPair, leftn, rightn, settings)
+                for leftn, rightn in pairs]
+        for (leftn, rightn), job in zip(pairs, jobs):
+            entry = {"left": leftn, "right": rightn}
+            try:
+                entry["findings"] = job.result()
+                entry["status"] = "different" if entry["findings"] \
+                    else "same"
+                report["differences"] += len(entry["findings"])
+            except Exception as _err:
+                entry["status"] = "error"
+                entry["error"] = "{0}: {1}".format(type(_err).__name__, _err)
+                report["errors"] += 1
+            report["pairs"].append(entry)
+
+    if report["errors"]:
+        status = 2
+    elif report["differences"] or lonly or ronly:
+        status = 1
+    else:
+        status = 0
+    return report, status
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "Mde:ghj:m:o:s")
+    dopts = dict(opts)
+
+    if "-h" in dopts:
+        usage()
+        sys.exit(0)
+
+    if len(args) < 2:
+        print("Two arguments are required")
+        sys.exit(1)
+
+    if "-g" in dopts:
+        geomMode = True
+        epsilon = float(dopts.get("-e", epsilon))
+        moveRadius = max(float(dopts.get("-m", moveRadius)), epsilon)
+    workers = int(dopts.get("-j", os.cpu_count() or 1))
+
+    if "-d" in dopts:
+        settings = {
+            "geom": geomMode,
+            "epsilon": epsilon,
+            "moveRadius": moveRadius,
+            "stream": "-s" in dopts,
+            "manifests": "-M" not in dopts
+        }
+        report, status = compareDirs(args[0], args[1], settings, workers)
+        if "-o" in dopts:
+            with open(dopts["-o"], "w") as outf:
+                json.dump(report, outf, indent=1)
+        else:
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        sys.exit(status)
+
+    if geomMode:
+        geomPool = ProcessPoolExecutor(max_workers=workers)
+
+    comparePair(args[0], args[1], "-s" in dopts, "-M" not in dopts)
 
-        # set up some ease-of-access variables
-        lefte = ljson[electorate]
-        righte = rjson[electorate]
-        #
-        # If the jurisdictions don't match then our inputs are
-        # just plain wrong
-        ljur = lefte["jurisdiction"]
-        rjur = righte["jurisdiction"]
-        if ljur != rjur:
-            print("Jurisdictions do NOT match ({left} vs {right}) for "
-                  "electorate {electorate}".format(
-                      left=ljur, right=rjur, electorate=electorate))
-
-        lloc = lefte["locality"]
-        rloc = righte["locality"]
-        if lloc != rloc:
-            print("Localities do NOT match ({left} vs {right})".format(
-                left=lloc, right=rloc))
-
-        # Have we missed any coordinate points?
-        lcset = set(lefte["coords"][0])
-        rcset = set(righte["coords"][0])
-        diffset = lcset - rcset
-        print("Electorate of {electorate} has coordinate differences: "
-              "{diffset} ".format(diffset=diffset, electorate=electorate))
+    if geomMode:
+        drainGeometry(0)
+        geomPool.shutdown()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import hashlib
+import json
+import os
+
+__doc__ = """
+Per-electorate content manifests for the JSON files written by
+SA1-to-mbpt.py, electorates.py and austwide.py.
+
+Each output file foo.json gets a foo.json.manifest alongside it, which
+records the jurisdiction, locality, vertex count and a SHA-256 digest of
+the coordinates of every electorate in foo.json, together with the size
+and mtime of foo.json itself. austwide.py writes each territory's
+details at the top level of its file rather than under its name, so its
+manifests are marked "single" and list just that one territory.
+jsoncheck.py compares manifests first, and
+only loads the geometry of electorates whose digests differ.
+"""
+
+SUFFIX = ".manifest"
+
+
+def manifestName(outfn):
+    """Returns the manifest filename for the output file outfn"""
+    return outfn + SUFFIX
+
+
+def coordsDigest(coords):
+    """
+    Returns a stable hex digest of coords. We hash the compact JSON
+    form, which is exactly what json.dump writes for the same floats.
+    """
+    return hashlib.sha256(json.dumps(
+        coords, separators=(",", ":")).encode("ascii")).hexdigest()
+
+
+def writeManifest(outfn, electorates, single=False):
+    """
+    Writes the manifest for outfn, which must already have been written
+    and closed. electorates is the same name: details mapping that was
+    dumped to outfn. With single, outfn holds the details of the one
+    area in electorates at its top level (as austwide.py writes them),
+    and the manifest says so.
+    """
+    if single and len(electorates) != 1:
+        raise ValueError("{0}: a single-area manifest needs exactly one "
+                         "area, not {1}".format(outfn, len(electorates)))
+    stinfo = os.stat(outfn)
+    entries = {}
+    for ename, details in electorates.items():
+        entries[ename] = {
+            "jurisdiction": details.get("jurisdiction"),
+            "locality": details.get("locality"),
+            "vertices": len(details["coords"]),
+            "coords": coordsDigest(details["coords"])
+        }
+    with open(manifestName(outfn), "w") as manf:
+        json.dump({
+            "source": os.path.basename(outfn),
+            "size": stinfo.st_size,
+            "mtime": stinfo.st_mtime_ns,
+            "single": single,
+            "electorates": entries
+        }, manf, indent=1, sort_keys=True)
+
+
+def readManifest(outfn):
+    """
+    Returns the manifest for outfn, or None if there isn't one, or if
+    outfn has changed since it was written.
+    """
+    try:
+        with open(manifestName(outfn), "r") as manf:
+            manifest = json.load(manf)
+        stinfo = os.stat(outfn)
+    except (OSError, ValueError) as _err:
+        return None
+    if manifest.get("size") != stinfo.st_size or \
+       manifest.get("mtime") != stinfo.st_mtime_ns:
+        return None
+    return manifest
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import bisect
+import getopt
+import math
+import sys
+
+from topo import DIGITS, quantise, readElectorates, splitRings
+
+__doc__ = """
+Nearest-electorate and distance-to-boundary queries over the JSON files
+written by SA1-to-mbpt.py, electorates.py and austwide.py, so that an
+address which falls outside every electorate (offshore, or badly
+geocoded) still gets an answer, and one close to a boundary can be
+flagged for a human to check.
+
+BoundaryIndex keeps only the outline of each electorate: an edge which
+turns up twice in the same electorate (such as the border between two
+of its mesh blocks in SA1-to-mbpt.py output) is internal, and dropped.
+The outline segments go into two grids of the same cell size:
+
+    cells   each segment is in every cell it passes through, so the
+            nearest boundary is found by searching outwards from the
+            query point's cell, a ring of cells at a time, until no
+            unsearched cell can hold anything closer. That's a few
+            rings near a boundary, but up to O(sqrt n) cells for a
+            point far from any, not logarithmic.
+
+    bands   each segment is in every band of latitude it spans, sorted
+            by its most easterly point, so a ray cast east from the
+            query point only meets the segments in one band which
+            reach past it. An odd number of crossings means inside.
+
+Distances are in km, on a local flat projection around the query point,
+which is plenty for the distances near a boundary that we care about.
+"""
+
+usagestr = """
+
+USAGE
+-----
+
+nearest.py [-r km] [-c cellsize] [-o outfile] file.json [file.json ...]
+
+    Reads lines of 'long,lat[,anything else]' from stdin, and for each
+    writes the line followed by the electorate containing the point
+    (or the nearest one, if none does), 1 if the point is inside it or
+    0 if not, the distance in km to that electorate's boundary, and
+    REVIEW if the point is outside every electorate or within km
+    (default 0.05) of the boundary. Output goes to outfile, or stdout.
+    An electorate name found in more than one of the files is an error.
+
+    cellsize is the size in degrees of the index grid; by default it's
+    picked so that each cell holds a few segments.
+
+"""
+
+REVIEWKM = 0.05
+
+# km per degree of latitude, and of longitude at the equator
+KMPERLAT = 110.574
+KMPERLON = 111.320
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def outline(coords, digits=DIGITS):
+    """
+    Returns the outline of coords as a list of ((x1, y1), (x2, y2))
+    segments, leaving out any edge which appears an even number of
+    times. That doesn't change which points are inside.
+    """
+    counts = {}
+    for ring in splitRings(coords):
+        keys = quantise(ring, digits)
+        for k in range(1, len(ring)):
+            a, b = keys[k - 1], keys[k]
+            if a == b:
+                continue
+            edge = (a, b) if a < b else (b, a)
+            if edge in counts:
+                counts[edge][1] += 1
+            else:
+                counts[edge] = [(tuple(ring[k - 1][:2]),
+                                 tuple(ring[k][:2])), 1]
+    return [seg for (seg, count) in counts.values() if count % 2]
+
+
+def segmentDistance(px, py, seg, kx):
+    """
+    Returns the distance in km from (px, py) to seg, with longitudes
+    scaled by kx and latitudes by KMPERLAT.
+    """
+    (x1, y1), (x2, y2) = seg
+    ax, ay = (x1 - px) * kx, (y1 - py) * KMPERLAT
+    bx, by = (x2 - px) * kx, (y2 - py) * KMPERLAT
+    dx, dy = bx - ax, by - ay
+    seglen = dx * dx + dy * dy
+    t = 0.0
+    if seglen > 0:
+        t = max(0.0, min(1.0, -(ax * dx + ay * dy) / seglen))
+    cx, cy = ax + t * dx, ay + t * dy
+    return math.sqrt(cx * cx + cy * cy)
+
+
+class BoundaryIndex(object):
+    """
+    Grid indexes over the outlines of electorates, a name: details
+    mapping in which each details has a "coords" list of [long, lat].
+    """
+
+    def __init__(self, electorates, cellsize=None):
+        self.names = []
+        segments = []
+        for ename, details in electorates.items():
+            owner = len(self.names)
+            self.names.append(ename)
+            segments.extend((seg, owner) for seg in
+                            outline(details["coords"]))
+        self.jurisdictions = [electorates[ename].get("jurisdiction")
+                              for ename in self.names]
+
+        xs = [pt[0] for (seg, _o) in segments for pt in seg] or [0.0]
+        ys = [pt[1] for (seg, _o) in segments for pt in seg] or [0.0]
+        self.x0, self.y0 = min(xs), min(ys)
+        width = max(max(xs) - self.x0, 1e-6)
+        height = max(max(ys) - self.y0, 1e-6)
+        if cellsize is None:
+            # About four segments to a cell
+            cellsize = math.sqrt(width * height * 4.0 /
+                                 max(1, len(segments)))
+        self.cellsize = cellsize
+        self.cols = int(width / cellsize) + 1
+        self.rows = int(height / cellsize) + 1
+
+        self.cells = {}
+        bands = {}
+        for entry in segments:
+            (x1, y1), (x2, y2) = entry[0]
+            for cell in self.traverse(x1, y1, x2, y2):
+                self.cells.setdefault(cell, []).append(entry)
+            for row in range(self.row(min(y1, y2)),
+                             self.row(max(y1, y2)) + 1):
+                bands.setdefault(row, []).append(entry)
+        self.bands = {}
+        for row, entries in bands.items():
+            entries.sort(key=lambda entry: max(entry[0][0][0],
+                                               entry[0][1][0]))
+            self.bands[row] = ([max(seg[0][0], seg[1][0])
+                                for (seg, _o) in entries], entries)
+
+    def col(self, x):
+        return int(math.floor((x - self.x0) / self.cellsize))
+
+    def row(self, y):
+        return int(math.floor((y - self.y0) / self.cellsize))
+
+    def traverse(self, x1, y1, x2, y2):
+        """
+        Returns the cells along a segment, sampled every half cell. A
+        cell the segment only clips the corner of may be missed, but
+        then its neighbour has it, which nearest() allows for.
+        """
+        steps = int(max(abs(x2 - x1), abs(y2 - y1)) /
+                    (self.cellsize / 2.0)) + 1
+        cells = set()
+        for k in range(steps + 1):
+            frac = k / float(steps)
+            cells.add((self.col(x1 + frac * (x2 - x1)),
+                       self.row(y1 + frac * (y2 - y1))))
+        return cells
+
+    def containing(self, lon, lat):
+        """Returns the set of names of the electorates containing lon, lat"""
+        band = self.bands.get(self.row(lat))
+        if band is None:
+            return set()
+        maxxs, entries = band
+        inside = set()
+        for k in range(bisect.bisect_left(maxxs, lon), len(entries)):
+            ((x1, y1), (x2, y2)), owner = entries[k]
+            if (y1 > lat) != (y2 > lat) and \
+               lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+                inside ^= set([owner])
+        return set(self.names[owner] for owner in inside)
+
+    def nearest(self, lon, lat, only=None):
+        """
+        Returns (name, km) for the boundary segment nearest lon, lat,
+        considering only the electorate named only if that's given, or
+        (None, None) if there are no segments.
+        """
+        kx = KMPERLON * math.cos(math.radians(lat))
+        # A ring of cells r out is at least r - 1 cells away, as the
+        # point can be anywhere in its own cell. A segment found there
+        # may also clip the corner of a cell in ring r - 1 which
+        # traverse() missed, so once rings up to r - 1 are searched,
+        # nothing unsearched is nearer than r - 2 cells.
+        cellkm = self.cellsize * min(kx, KMPERLAT)
+        owner = None if only is None else self.names.index(only)
+        pcol, prow = self.col(lon), self.row(lat)
+        # Offshore points start at the first ring to reach the grid
+        start = max(0, -pcol, pcol - self.cols + 1, -prow,
+                    prow - self.rows + 1)
+        best, bestowner = None, None
+        for r in range(start, start + max(self.cols, self.rows) + 2):
+            if best is not None and best <= (r - 2) * cellkm:
+                break
+            for cell in self.ring(pcol, prow, r):
+                for (seg, segowner) in self.cells.get(cell, ()):
+                    if owner is not None and segowner != owner:
+                        continue
+                    dist = segmentDistance(lon, lat, seg, kx)
+                    if best is None or dist < best:
+                        best, bestowner = dist, segowner
+        if bestowner is None:
+            return None, None
+        return self.names[bestowner], best
+
+    def ring(self, pcol, prow, r):
+        """Yields the cells of the grid r cells out from (pcol, prow)"""
+        if r == 0:
+            yield (pcol, prow)
+            return
+        lo, hi = max(0, pcol - r), min(self.cols - 1, pcol + r)
+        for row in (prow - r, prow + r):
+            if 0 <= row < self.rows:
+                for col in range(lo, hi + 1):
+                    yield (col, row)
+        lo, hi = max(0, prow - r + 1), min(self.rows - 1, prow + r - 1)
+        for col in (pcol - r, pcol + r):
+            if 0 <= col < self.cols:
+                for row in range(lo, hi + 1):
+                    yield (col, row)
+
+    def query(self, lon, lat):
+        """
+        Returns (name, inside, km): the electorate containing lon, lat
+        and the distance to its boundary, or if no electorate contains
+        it, the electorate with the nearest boundary, and how far away
+        that is.
+        """
+        inside = self.containing(lon, lat)
+        if inside:
+            ename = sorted(inside)[0]
+            _name, dist = self.nearest(lon, lat, ename)
+            return ename, True, dist
+        ename, dist = self.nearest(lon, lat)
+        return ename, False, dist
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "c:ho:r:")
+    dopts = dict(opts)
+
+    if "-h" in dopts or len(args) < 1:
+        usage()
+        sys.exit(0 if "-h" in dopts else 1)
+
+    try:
+        electorates = readElectorates(args)
+    except ValueError as _err:
+        print("Error: {0}".format(_err), file=sys.stderr)
+        sys.exit(1)
+
+    cellsize = float(dopts["-c"]) if "-c" in dopts else None
+    index = BoundaryIndex(electorates, cellsize)
+    reviewkm = float(dopts.get("-r", REVIEWKM))
+
+    outf = open(dopts["-o"], "w") if "-o" in dopts else sys.stdout
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        fields = line.split(",")
+        try:
+            lon, lat = float(fields[0]), float(fields[1])
+        except (IndexError, ValueError) as _err:
+            print("{0},,,,BADPOINT".format(line), file=outf)
+            continue
+        ename, inside, dist = index.query(lon, lat)
+        review = not inside or dist is None or dist < reviewkm
+        print("{0},{1},{2},{3},{4}".format(
+            line, ename or "", 1 if inside else 0,
+            "" if dist is None else "{0:.4f}".format(dist),
+            "REVIEW" if review else ""), file=outf)
+    if outf is not sys.stdout:
+        outf.close()
@@ -38,29 +38,76 @@ mapping and (2) JSON formatted.
 Performs basic validation on the input postcode based on the free
 Australia Postcode dataset downloaded from
 https://www.aggdata.com/system/files_force/samples/au_postal_codes.csv?download=1
+
+Parsed results are cached in a local SQLite database, keyed by postcode
+and results page, so that repeat queries do not go back to the AEC.
+Electorate assignments only change at redistributions, so whenever
+SA1-to-mbpt.py has to be re-run you should also clear the cache (-C).
 """
 
 import csv
+import getopt
 import json
 import os
 import re
+import sqlite3
+import struct
 import sys
+import time
 
-import requests
+from html.parser import HTMLParser
 
-from bs4 import BeautifulSoup
+# requests and bs4 are imported where they are needed, so that rejected
+# postcodes and cache hits don't pay for loading them.
 
+# Bitmap over 0000-9999, one bit per valid postcode. It's compiled from
+# the CSV into postCodeFile + ".idx" and only rebuilt when the CSV changes.
+postCodeFile = os.path.join(os.getenv("HOME"),
+                            "OneDrive/scraping/au_postal_codes.csv")
+postCodeIndex = bytearray(10000 // 8)
+# Format tag, CSV mtime (ns) and size, followed by the bitmap. The tag
+# changes whenever the way we read the CSV does, to drop stale indexes.
+indexTag = b"PC02"
+indexHdr = struct.Struct("<4sqq")
 
-allPostCodes = set()
 fields = ["State", "Locality", "Postcode", "Electorate",
           "RedistributedElectorate", "OtherLocality"]
 
 # For result pages > 1 we need to pass a dict of ASP.net args
 payload = {}
 followups = set()
+aecURL = "https://electorate.aec.gov.au/LocalitySearchResults.aspx"
 eventTgt = "ctl00$ContentPlaceHolderBody$gridViewLocalities"
 tblAttr = "ContentPlaceHolderBody_gridViewLocalities"
 
+# Where we keep previously-parsed results, and for how long (seconds)
+cacheFile = os.path.join(os.getenv("HOME"), ".aec-cache.sqlite")
+cacheTTL = 30 * 86400
+cacheStats = {"hits": 0, "misses": 0}
+
+usagestr = """
+
+postcode.py [-n] [-r] [-s] [-t days] [-d cachefile] [-p csvfile]
+            [-u url] postcode
+postcode.py -C [-d cachefile]
+postcode.py -h
+
+    -n  bypass the cache entirely (neither read from nor write to it)
+    -r  refresh: ignore any cached entry, query the AEC and update the cache
+    -s  print cache hit/miss statistics to stderr
+    -t  number of days a cached entry remains valid (default 30)
+    -d  path to the cache database (default ~/.aec-cache.sqlite)
+    -p  path to au_postal_codes.csv
+        (default ~/OneDrive/scraping/au_postal_codes.csv)
+    -u  LocalitySearchResults.aspx URL to query, eg an aec-standin.py
+        instance (default the AEC's own)
+    -C  remove every cached entry, eg after a redistribution
+
+"""
+
+# Exactly four ASCII digits, so "800" and "２０００" aren't postcodes
+postCodeRE = re.compile("[0-9]{4}")
+
 linkRE = re.compile(
     ".*__doPostBack.'(.*?gridViewLocalities)','(Page.[0-9]+)'.*")
 
@@ -98,22 +145,127 @@ def findFollowups(soup):
     payload["__EVENTTARGET"] = eventTgt
 
 
-def queryAEC(postcode, extrapage):
+class AECExtractor(HTMLParser):
     """
-    Queries the AEC url and returns soup. If extrapage is empty
-    then we pass the soup to findFollowups before returning.
+    Streaming extractor for LocalitySearchResults pages. Rather than
+    building a tree of the whole page we only look at the "__" hidden
+    inputs, the __doPostBack paging links and the rows of the
+    gridViewLocalities table; everything else is skipped as it streams
+    past.
     """
-    url = "https://electorate.aec.gov.au/LocalitySearchResults.aspx?"
-    url += "filter={0}&filterby=Postcode"
 
-    if not extrapage:
-        res = requests.post(url.format(postcode))
-    else:
-        payload["__EVENTARGUMENT"] = extrapage
-        res = requests.post(url.format(postcode), data=payload)
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hidden = {}
+        self.pages = set()
+        self.results = []
+        self._tdepth = 0     # table nesting, 1 == the results table
+        self._nrows = 0
+        self._done = False   # reached the paging row
+        self._row = None
+        self._cell = None    # text chunks of the current cell
+        self._kids = None    # per-level child counts within the cell
 
-    resh = BeautifulSoup(res.text, "html.parser")
-    if not extrapage:
+    def handle_starttag(self, tag, attrs):
+        if tag == "input":
+            attrs = dict(attrs)
+            if (attrs.get("name") or "").startswith("__"):
+                self.hidden[attrs["name"]] = attrs.get("value", "")
+            return
+        if tag == "a":
+            arg = isDoPostBack(dict(attrs).get("href"))
+            if arg:
+                self.pages.add(arg)
+        if tag == "table":
+            if self._kids is not None:
+                self._child(tag)
+            if self._tdepth or dict(attrs).get("id") == tblAttr:
+                self._tdepth += 1
+            return
+        if self._tdepth != 1 or self._done:
+            if self._kids is not None:
+                self._child(tag)
+            return
+        if tag == "tr" and self._cell is None:
+            self._nrows += 1
+            cls = dict(attrs).get("class") or ""
+            if cls.startswith("pagingLink"):
+                self._done = True
+            elif self._nrows > 1:
+                # We skip the header row
+                self._row = []
+        elif tag == "td" and self._row is not None and self._cell is None:
+            self._cell = []
+            self._kids = [0]
+        elif self._kids is not None:
+            self._child(tag)
+
+    def _child(self, tag):
+        """Tracks nesting inside a cell, so we can mimic bs4's .string"""
+        self._kids[-1] += 1
+        if tag not in ("br", "img", "input", "hr", "wbr"):
+            self._kids.append(0)
+
+    def handle_endtag(self, tag):
+        if tag == "table" and self._tdepth:
+            self._tdepth -= 1
+            if self._kids is not None and len(self._kids) > 1:
+                self._kids.pop()
+            return
+        if self._tdepth != 1:
+            if self._kids is not None and len(self._kids) > 1:
+                self._kids.pop()
+            return
+        if tag == "td" and self._cell is not None:
+            # A cell with more than one child at any level has no
+            # single string, which ends the row.
+            if self._cell and max(self._kids) == 1:
+                self._row.append("".join(self._cell))
+            else:
+                self._row.append(None)
+            self._cell = self._kids = None
+        elif tag == "tr" and self._row is not None and self._cell is None:
+            resdict = {}
+            for i, tdata in enumerate(self._row):
+                if tdata is None:
+                    break
+                resdict[fields[i]] = tdata
+            if resdict:
+                self.results.append(resdict)
+            self._row = None
+        elif self._kids is not None and len(self._kids) > 1:
+            self._kids.pop()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._kids[-1] += 1
+            self._cell.append(data)
+
+
+def parseResults(text, firstpage):
+    """
+    Extracts the results rows from an AEC response. For the first page
+    we also update payload and followups for the caller.
+    """
+    ext = AECExtractor()
+    ext.feed(text)
+    ext.close()
+    if firstpage:
+        payload.update(ext.hidden)
+        payload["__EVENTTARGET"] = eventTgt
+        followups.update(ext.pages)
+    return ext.results
+
+
+def parseResultsSoup(text, firstpage):
+    """
+    The original whole-page BeautifulSoup parse, kept as the reference
+    that aec-parse-bench.py measures parseResults against.
+    """
+    from bs4 import BeautifulSoup
+
+    resh = BeautifulSoup(text, "html.parser")
+    if firstpage:
         findFollowups(resh)
 
     restbl = resh.find_all(name="table",
@@ -138,6 +290,99 @@ def queryAEC(postcode, extrapage):
     return results
 
 
+def queryAEC(postcode, extrapage):
+    """
+    Queries the AEC url and returns the parsed results. If extrapage is
+    empty then we also note any followup pages.
+    """
+    import requests
+
+    url = aecURL + "?filter={0}&filterby=Postcode"
+
+    if not extrapage:
+        res = requests.post(url.format(postcode))
+    else:
+        payload["__EVENTARGUMENT"] = extrapage
+        res = requests.post(url.format(postcode), data=payload)
+    res.raise_for_status()
+
+    return parseResults(res.text, not extrapage)
+
+
+def openCache(path):
+    """Opens (creating if necessary) the results cache, returns the handle"""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                 "postcode TEXT, page TEXT, fetched REAL, "
+                 "followups TEXT, results TEXT, "
+                 "PRIMARY KEY (postcode, page))")
+    conn.execute("CREATE TABLE IF NOT EXISTS stats ("
+                 "name TEXT PRIMARY KEY, count INTEGER)")
+    return conn
+
+
+def cacheGet(conn, postcode, page, ttl):
+    """
+    Returns the cached results for postcode/page if we have them and they
+    are younger than ttl seconds, otherwise None. A hit on the first page
+    also restores the global followups set.
+    """
+    row = conn.execute("SELECT fetched, followups, results FROM results "
+                       "WHERE postcode = ? AND page = ?",
+                       (postcode, page or "")).fetchone()
+    if row is None or time.time() - row[0] > ttl:
+        cacheStats["misses"] += 1
+        return None
+    cacheStats["hits"] += 1
+    if not page:
+        followups.update(json.loads(row[1]))
+    return json.loads(row[2])
+
+
+def cachePut(conn, postcode, page, results):
+    """Stores results for postcode/page, along with any followup pages"""
+    conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                 (postcode, page or "", time.time(),
+                  json.dumps(sorted(followups) if not page else []),
+                  json.dumps(results)))
+    conn.commit()
+
+
+def cacheClear(conn):
+    """Invalidates every cached entry, returns how many were removed"""
+    removed = conn.execute("DELETE FROM results").rowcount
+    conn.commit()
+    return removed
+
+
+def cacheSaveStats(conn):
+    """Folds this run's hit/miss counts into the persistent totals"""
+    for name, count in cacheStats.items():
+        conn.execute("INSERT OR IGNORE INTO stats VALUES (?, 0)", (name,))
+        conn.execute("UPDATE stats SET count = count + ? WHERE name = ?",
+                     (count, name))
+    conn.commit()
+    return dict(conn.execute("SELECT name, count FROM stats").fetchall())
+
+
+def cachedQueryAEC(conn, postcode, extrapage, ttl, refresh):
+    """
+    Wraps queryAEC with the results cache. If refresh is set we always go
+    to the AEC, but still store what we get back.
+    """
+    if not refresh:
+        results = cacheGet(conn, postcode, extrapage, ttl)
+        if results is not None:
+            return results
+    if extrapage and "__VIEWSTATE" not in payload:
+        # The first page came from the cache, so we don't have the
+        # ASP.net state needed to ask for this one. Fetch it again.
+        cachePut(conn, postcode, None, queryAEC(postcode, None))
+    results = queryAEC(postcode, extrapage)
+    cachePut(conn, postcode, extrapage, results)
+    return results
+
+
 def output(results, fmt):
     """ prints the results to stdout, using fmt """
     if fmt == "raw":
@@ -155,28 +400,103 @@ def output(results, fmt):
         sys.exit(1)
 
 
-def setupPostCodes():
-    """Reads in the postcode file, updates allPostCodes"""
-    homedir = os.getenv("HOME")
-    pcf = open(os.path.join(homedir,
-                            "OneDrive/scraping/au_postal_codes.csv"), "r")
-    csvr = csv.reader(pcf)
-    for row in csvr:
-        allPostCodes.add(row[0])
+def setupPostCodes(csvpath):
+    """
+    Loads postCodeIndex from the compiled index for csvpath, rebuilding
+    (and, if we can, saving) the index when the CSV has changed.
+    """
+    stinfo = os.stat(csvpath)
+    idxpath = csvpath + ".idx"
+    try:
+        with open(idxpath, "rb") as idxf:
+            tag, mtime, size = indexHdr.unpack(idxf.read(indexHdr.size))
+            if tag == indexTag and mtime == stinfo.st_mtime_ns and \
+               size == stinfo.st_size:
+                idxf.readinto(postCodeIndex)
+                return
+    except (OSError, struct.error) as _err:
+        pass
+
+    with open(csvpath, "r") as pcf:
+        for row in csv.reader(pcf):
+            if row and postCodeRE.fullmatch(row[0]):
+                pcode = int(row[0])
+                postCodeIndex[pcode >> 3] |= 1 << (pcode & 7)
+    try:
+        with open(idxpath, "wb") as idxf:
+            idxf.write(indexHdr.pack(indexTag, stinfo.st_mtime_ns,
+                                     stinfo.st_size))
+            idxf.write(postCodeIndex)
+    except OSError as _err:
+        # Not fatal, we'll just rebuild the index next time
+        pass
+
+
+def validPostCode(postcode):
+    """Checks postcode against postCodeIndex"""
+    if not postCodeRE.fullmatch(postcode):
+        return False
+    pcode = int(postcode)
+    return bool(postCodeIndex[pcode >> 3] & (1 << (pcode & 7)))
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
 
 
 def main():
     """Does setup tasks then queries the AEC website"""
-    postcode = sys.argv[1]
-    setupPostCodes()
-    if postcode not in allPostCodes:
+    opts, args = getopt.getopt(sys.argv[1:], "Cd:hnp:rst:u:")
+    dopts = dict(opts)
+
+    if "-h" in dopts:
+        usage()
+        sys.exit(0)
+
+    global aecURL
+    aecURL = dopts.get("-u", aecURL)
+    cachepath = dopts.get("-d", cacheFile)
+    ttl = float(dopts["-t"]) * 86400 if "-t" in dopts else cacheTTL
+
+    if "-C" in dopts:
+        conn = openCache(cachepath)
+        print("Removed {0} cached entries from {1}".format(
+            cacheClear(conn), cachepath))
+        conn.close()
+        if not args:
+            sys.exit(0)
+
+    if len(args) < 1:
+        usage()
+        sys.exit(1)
+
+    postcode = args[0]
+    setupPostCodes(dopts.get("-p", postCodeFile))
+    if not validPostCode(postcode):
         print("Error: {0} is not a valid post code".format(postcode),
               file=sys.stderr)
         sys.exit(1)
-    results = queryAEC(postcode, None)
-    if followups:
-        for nth in followups:
+
+    if "-n" in dopts:
+        results = queryAEC(postcode, None)
+        for nth in sorted(followups):
             results.extend(queryAEC(postcode, nth))
+    else:
+        conn = openCache(cachepath)
+        refresh = "-r" in dopts
+        results = cachedQueryAEC(conn, postcode, None, ttl, refresh)
+        for nth in sorted(followups):
+            results.extend(cachedQueryAEC(conn, postcode, nth, ttl, refresh))
+        totals = cacheSaveStats(conn)
+        conn.close()
+        if "-s" in dopts:
+            print("cache: {0} hits, {1} misses this run; "
+                  "{2} hits, {3} misses in total".format(
+                      cacheStats["hits"], cacheStats["misses"],
+                      totals.get("hits", 0), totals.get("misses", 0)),
+                  file=sys.stderr)
     output(results, "raw")
     output(results, "json")
 
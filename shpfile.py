@@ -0,0 +1,234 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import mmap
+import os
+import struct
+
+__doc__ = """
+A reader for ESRI shapefiles (.shp, .shx and .dbf), such as the ABS
+and Electoral Commission boundary downloads, so that SA1-to-mbpt.py,
+electorates.py and austwide.py can read them directly instead of via
+an ogr2ogr conversion to GML or KML.
+
+Each file is mmap()ed, and whole arrays (part offsets, points, record
+offsets, attribute fields) are decoded with a single struct call, so
+the cost is close to that of copying the floats out. Only polygon,
+polyline, multipoint and point shapes (with or without Z and M) are
+understood; we keep the X and Y of each point, which for these files
+are longitude and latitude.
+"""
+
+FILECODE = 9994
+
+HEADERLEN = 100
+
+# shape type: True if it has parts, False if it's a list of points
+SHAPETYPES = {
+    1: False, 11: False, 21: False,     # Point, PointZ, PointM
+    3: True, 13: True, 23: True,        # PolyLine, PolyLineZ, PolyLineM
+    5: True, 15: True, 25: True,        # Polygon, PolygonZ, PolygonM
+    8: False, 18: False, 28: False      # MultiPoint, MultiPointZ, ...M
+}
+
+RECHDR = struct.Struct(">ii")
+
+DBFHDR = struct.Struct("<BBBBIHH20x")
+
+DBFFIELD = struct.Struct("<11sc4xBB14x")
+
+
+def openMap(fname):
+    """Returns a read-only mmap of fname"""
+    with open(fname, "rb") as inf:
+        return mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def checkHeader(mm, fname):
+    """Raises ValueError unless mm starts with a shapefile header"""
+    if len(mm) < HEADERLEN or \
+       struct.unpack_from(">i", mm, 0)[0] != FILECODE:
+        raise ValueError("{0} is not a shapefile".format(fname))
+
+
+def shapeOffsets(shp, shxfn):
+    """
+    Returns the byte offset of each record in shp, from the index in
+    shxfn if there is one, otherwise by walking the record headers.
+    """
+    if os.path.exists(shxfn):
+        shx = openMap(shxfn)
+        try:
+            checkHeader(shx, shxfn)
+            count = (len(shx) - HEADERLEN) // 8
+            index = struct.unpack_from(">{0}i".format(2 * count), shx,
+                                       HEADERLEN)
+        finally:
+            shx.close()
+        return [2 * index[k] for k in range(0, len(index), 2)]
+
+    offsets = []
+    pos = HEADERLEN
+    while pos + RECHDR.size <= len(shp):
+        offsets.append(pos)
+        _recno, words = RECHDR.unpack_from(shp, pos)
+        pos += RECHDR.size + 2 * words
+    return offsets
+
+
+def readShape(shp, pos):
+    """
+    Returns the parts of the shape whose record starts at pos, each a
+    list of [x, y] points. A null shape has no parts.
+    """
+    pos += RECHDR.size
+    shapetype = struct.unpack_from("<i", shp, pos)[0]
+    if shapetype == 0:
+        return []
+    if shapetype not in SHAPETYPES:
+        raise ValueError("unsupported shape type {0}".format(shapetype))
+
+    if shapetype in (1, 11, 21):
+        return [[list(struct.unpack_from("<2d", shp, pos + 4))]]
+
+    if SHAPETYPES[shapetype]:
+        nparts, npoints = struct.unpack_from("<ii", shp, pos + 36)
+        starts = struct.unpack_from("<{0}i".format(nparts), shp, pos + 44)
+        ptpos = pos + 44 + 4 * nparts
+    else:
+        npoints = struct.unpack_from("<i", shp, pos + 36)[0]
+        starts = (0,)
+        ptpos = pos + 40
+
+    flat = struct.unpack_from("<{0}d".format(2 * npoints), shp, ptpos)
+    points = [[flat[k], flat[k + 1]] for k in range(0, len(flat), 2)]
+    ends = list(starts[1:]) + [npoints]
+    return [points[start:end] for (start, end) in zip(starts, ends)]
+
+
+def dbfEncoding(basename):
+    """Returns the attribute encoding given by a .cpg, or latin-1"""
+    try:
+        with open(basename + ".cpg", "r") as cpgf:
+            encoding = cpgf.read().strip()
+    except OSError as _err:
+        return "latin-1"
+    try:
+        "".encode(encoding)
+    except LookupError as _err:
+        return "latin-1"
+    return encoding
+
+
+def dbfFields(dbf):
+    """
+    Returns (fields, count, headerlen, recordlen) for the .dbf in dbf,
+    where fields is a list of (name, type, length, decimals).
+    """
+    (_version, _yy, _mm, _dd, count, headerlen,
+     recordlen) = DBFHDR.unpack_from(dbf, 0)
+    fields = []
+    pos = DBFHDR.size
+    while pos < headerlen - 1 and dbf[pos] != 0x0d:
+        name, ftype, length, decimals = DBFFIELD.unpack_from(dbf, pos)
+        fields.append((name.split(b"\0")[0].decode("ascii"),
+                       ftype.decode("ascii"), length, decimals))
+        pos += DBFFIELD.size
+    return fields, count, headerlen, recordlen
+
+
+def dbfValue(raw, ftype, decimals, encoding):
+    """Returns the Python value of one raw .dbf field"""
+    if ftype in "NF":
+        raw = raw.strip()
+        if not raw or raw.startswith(b"*"):
+            return None
+        if decimals == 0 and ftype == "N":
+            try:
+                return int(raw)
+            except ValueError as _err:
+                pass
+        return float(raw)
+    if ftype == "L":
+        return {b"Y": True, b"y": True, b"T": True, b"t": True,
+                b"N": False, b"n": False, b"F": False,
+                b"f": False}.get(raw, None)
+    return raw.decode(encoding).strip()
+
+
+def iterRecords(dbffn):
+    """
+    Yields (index, record) for each record in dbffn which hasn't been
+    deleted, where record is a field name: value dict.
+    """
+    encoding = dbfEncoding(os.path.splitext(dbffn)[0])
+    dbf = openMap(dbffn)
+    try:
+        fields, count, headerlen, recordlen = dbfFields(dbf)
+        # One struct call slices out every field of a record
+        layout = struct.Struct("<1x" + "".join(
+            "{0}s".format(length) for (_n, _t, length, _d) in fields))
+        for index in range(count):
+            pos = headerlen + index * recordlen
+            if dbf[pos] == 0x2a:
+                # '*' marks a deleted record
+                continue
+            values = layout.unpack_from(dbf, pos)
+            yield index, dict(
+                (name, dbfValue(raw, ftype, decimals, encoding))
+                for ((name, ftype, _l, decimals), raw) in
+                zip(fields, values))
+    finally:
+        dbf.close()
+
+
+def iterShapes(shpfn, wanted=None):
+    """
+    Yields (record, parts) for each feature of the shapefile shpfn,
+    reading the attributes from the .dbf and the record offsets from
+    the .shx alongside it. parts is a list of rings (or lines), each a
+    list of [x, y] points. If wanted is given, it is called with each
+    record first, and features it returns False for are skipped before
+    their geometry is decoded.
+    """
+    basename = os.path.splitext(shpfn)[0]
+    shp = openMap(shpfn)
+    try:
+        checkHeader(shp, shpfn)
+        offsets = shapeOffsets(shp, basename + ".shx")
+        for index, record in iterRecords(basename + ".dbf"):
+            if wanted is not None and not wanted(record):
+                continue
+            if index >= len(offsets):
+                break
+            yield record, readShape(shp, offsets[index])
+    finally:
+        shp.close()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import json
+import math
+import os
+import sys
+
+from topo import readElectorates, splitRings
+
+__doc__ = """
+Spatially sharded output of the JSON files written by SA1-to-mbpt.py,
+electorates.py and austwide.py, so that consumers can load just the
+part of a state they are drawing or querying.
+
+writeTiles() clips every electorate to the tiles of the usual z/x/y
+web map pyramid at one zoom level, and writes each tile which anything
+touches as DIR/z/x/y.json, holding the same name: details mapping as
+the source file but with only the coordinates inside that tile. The
+source coordinates string the rings of many mesh blocks together, so
+each ring is clipped on its own, and "coords" in a tile is a list of
+the closed rings which reach into it. Tile
+edges are lines of constant longitude and latitude, so the clipping
+(Sutherland-Hodgman, against each edge in turn) is done directly on
+[long, lat] points. DIR/index.json records the zoom level, the
+electorates in each tile, and the bounding box and tiles of each
+electorate.
+"""
+
+usagestr = """
+
+USAGE
+-----
+
+tiles.py [-z zoom] infile.json outdir
+tiles.py -l long,lat tiledir
+
+    Without -l, shard infile (output of SA1-to-mbpt.py, electorates.py
+    or austwide.py) into tiles at zoom level zoom (default 10, about
+    40km across) under outdir.
+
+    With -l, print the electorates in the tile of tiledir which covers
+    the point long,lat.
+
+"""
+
+SUFFIX = ".tiles"
+
+INDEX = "index.json"
+
+ZOOM = 10
+
+# The web mercator pyramid stops short of the poles
+MAXLAT = math.degrees(math.atan(math.sinh(math.pi)))
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def tilesName(outfn):
+    """Returns the tile directory name for the output file outfn"""
+    if outfn.endswith(".json"):
+        outfn = outfn[:-len(".json")]
+    return outfn + SUFFIX
+
+
+def tileBounds(z, x, y):
+    """Returns the (west, south, east, north) of tile z/x/y, in degrees"""
+    n = 2 ** z
+    west = x * 360.0 / n - 180.0
+    east = (x + 1) * 360.0 / n - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2.0 * y / n))))
+    south = math.degrees(math.atan(math.sinh(
+        math.pi * (1 - 2.0 * (y + 1) / n))))
+    return (west, south, east, north)
+
+
+def tileFor(lon, lat, z):
+    """Returns the (x, y) of the tile at zoom z which covers lon, lat"""
+    n = 2 ** z
+    lat = max(-MAXLAT, min(MAXLAT, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    rad = math.radians(lat)
+    y = int((1 - math.log(math.tan(rad) + 1 / math.cos(rad)) / math.pi) /
+            2 * n)
+    return (min(n - 1, max(0, x)), min(n - 1, max(0, y)))
+
+
+def boundingBox(coords):
+    """Returns the (west, south, east, north) of coords"""
+    lons = [pt[0] for pt in coords]
+    lats = [pt[1] for pt in coords]
+    return (min(lons), min(lats), max(lons), max(lats))
+
+
+def clipEdge(coords, axis, limit, keepBelow):
+    """
+    One Sutherland-Hodgman pass: clips the closed ring coords to the
+    half-plane where coordinate axis is <= limit (keepBelow) or >= limit.
+    """
+    def inside(pt):
+        return pt[axis] <= limit if keepBelow else pt[axis] >= limit
+
+    def crossing(a, b):
+        frac = (limit - a[axis]) / (b[axis] - a[axis])
+        pt = [a[0] + frac * (b[0] - a[0]), a[1] + frac * (b[1] - a[1])]
+        pt[axis] = limit
+        return pt
+
+    clipped = []
+    prev = coords[-1]
+    for pt in coords:
+        if inside(pt):
+            if not inside(prev):
+                clipped.append(crossing(prev, pt))
+            clipped.append(pt)
+        elif inside(prev):
+            clipped.append(crossing(prev, pt))
+        prev = pt
+    return clipped
+
+
+def clipBox(coords, box):
+    """Returns coords clipped to box, closed again if coords was"""
+    west, south, east, north = box
+    clipped = coords
+    for (axis, limit, keepBelow) in ((0, west, False), (0, east, True),
+                                     (1, south, False), (1, north, True)):
+        if not clipped:
+            break
+        clipped = clipEdge(clipped, axis, limit, keepBelow)
+    if clipped and coords[0] == coords[-1] and clipped[0] != clipped[-1]:
+        clipped.append(clipped[0])
+    return clipped
+
+
+def shardCoords(coords, zoom):
+    """
+    Returns {(x, y): [clipped ring, ...]} for every tile at zoom which
+    the rings of coords cover. We clip each ring our way down the
+    pyramid a quadrant at a time, so that each point is only clipped
+    against the tiles near it.
+    """
+    shards = {}
+
+    def descend(z, x, y, part, bbox):
+        if z == zoom:
+            shards.setdefault((x, y), []).append(part)
+            return
+        for (cx, cy) in ((2 * x, 2 * y), (2 * x + 1, 2 * y),
+                         (2 * x, 2 * y + 1), (2 * x + 1, 2 * y + 1)):
+            box = tileBounds(z + 1, cx, cy)
+            if bbox[2] < box[0] or bbox[0] > box[2] or \
+               bbox[3] < box[1] or bbox[1] > box[3]:
+                continue
+            if box[0] <= bbox[0] and bbox[2] <= box[2] and \
+               box[1] <= bbox[1] and bbox[3] <= box[3]:
+                descend(z + 1, cx, cy, part, bbox)
+                continue
+            clipped = clipBox(part, box)
+            if len(clipped) >= 3:
+                descend(z + 1, cx, cy, clipped, boundingBox(clipped))
+
+    for ring in splitRings(coords):
+        descend(0, 0, 0, ring, boundingBox(ring))
+    return shards
+
+
+def tileKey(zoom, x, y):
+    return "{0}/{1}/{2}".format(zoom, x, y)
+
+
+def writeTiles(outdir, electorates, zoom=ZOOM):
+    """
+    Writes the tiles and index for electorates, a name: details mapping
+    in which each details has a "coords" list of [long, lat] points.
+    outdir is created if need be.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    tiles = {}
+    index = {}
+    for ename, details in electorates.items():
+        shards = shardCoords(details["coords"], zoom)
+        for (x, y), rings in shards.items():
+            clipped = dict(details)
+            clipped["coords"] = rings
+            tiles.setdefault((x, y), {})[ename] = clipped
+        index[ename] = {
+            "jurisdiction": details.get("jurisdiction"),
+            "locality": details.get("locality"),
+            "bbox": boundingBox(details["coords"]) if details["coords"]
+            else None,
+            "tiles": sorted(tileKey(zoom, x, y) for (x, y) in shards)
+        }
+
+    for (x, y), contents in tiles.items():
+        tiledir = os.path.join(outdir, str(zoom), str(x))
+        os.makedirs(tiledir, exist_ok=True)
+        with open(os.path.join(tiledir, "{0}.json".format(y)), "w") as tilef:
+            json.dump(contents, tilef, separators=(",", ":"))
+
+    with open(os.path.join(outdir, INDEX), "w") as indexf:
+        json.dump({
+            "zoom": zoom,
+            "tiles": dict((tileKey(zoom, x, y), sorted(contents))
+                          for (x, y), contents in sorted(tiles.items())),
+            "electorates": index
+        }, indexf, indent=1, sort_keys=True)
+
+
+def readIndex(tiledir):
+    """Returns the index of the tiles in tiledir"""
+    with open(os.path.join(tiledir, INDEX), "r") as indexf:
+        return json.load(indexf)
+
+
+def readTileAt(tiledir, lon, lat, zoom=None):
+    """
+    Returns the name: details mapping from the tile in tiledir which
+    covers lon, lat; it's empty if no electorate touches that tile.
+    """
+    if zoom is None:
+        zoom = readIndex(tiledir)["zoom"]
+    x, y = tileFor(lon, lat, zoom)
+    try:
+        with open(os.path.join(tiledir, str(zoom), str(x),
+                               "{0}.json".format(y)), "r") as tilef:
+            return json.load(tilef)
+    except FileNotFoundError as _err:
+        return {}
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "hl:z:")
+    dopts = dict(opts)
+
+    if "-h" in dopts or len(args) < 1:
+        usage()
+        sys.exit(0 if "-h" in dopts else 1)
+
+    if "-l" in dopts:
+        lon, lat = map(float, dopts["-l"].split(","))
+        for ename, details in sorted(readTileAt(args[0], lon, lat).items()):
+            print("{0:30} {1}".format(ename, details.get("jurisdiction")))
+        sys.exit(0)
+
+    if len(args) < 2:
+        usage()
+        sys.exit(1)
+
+    electorates = readElectorates(args[:1])
+    writeTiles(args[1], electorates, int(dopts.get("-z", ZOOM)))
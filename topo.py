@@ -0,0 +1,304 @@
+#!/usr/bin/env python3.7
+
+#
+# Copyright (c) 2019, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import json
+import sys
+
+__doc__ = """
+Shared-arc, quantised encoding of the JSON files written by
+SA1-to-mbpt.py, electorates.py and austwide.py.
+
+Neighbouring electorates each carry a full copy of their common border,
+as full-precision floats. encodeTopology() rounds every coordinate to a
+fixed number of decimal places, cuts each electorate's coordinates into
+arcs wherever they stop being shared with the same neighbours, and then
+stores each distinct arc just once. An electorate becomes a list of arc
+indices, with ~i meaning arc i reversed, as in TopoJSON.
+
+Each arc is a flat list of integers: the first point in units of the
+quantum, then the difference from the previous point for each point
+after that. Mostly these are small numbers, which is what makes the
+file both small and quick to parse.
+
+decodeTopology() expands a topology back to the original name: details
+mapping, with each point rounded to the quantum.
+"""
+
+usagestr = """
+
+USAGE
+-----
+
+topo.py [-q digits] infile.json outfile.json
+topo.py -d infile.json outfile.json
+
+    Without -d, encode infile (output of SA1-to-mbpt.py, electorates.py
+    or austwide.py) as a topology in outfile, keeping digits decimal
+    places of each coordinate (default 6, about 10cm).
+
+    With -d, decode the topology in infile back to outfile.
+
+"""
+
+SUFFIX = ".topo.json"
+
+DIGITS = 6
+
+# Marks a point which is shared by sequences with different neighbours
+JUNCTION = object()
+
+
+def usage():
+    """ Provides the usage statement for this utility """
+    print(__doc__)
+    print(usagestr)
+
+
+def topoName(outfn):
+    """Returns the topology filename for the output file outfn"""
+    if outfn.endswith(".json"):
+        outfn = outfn[:-len(".json")]
+    return outfn + SUFFIX
+
+
+def quantise(coords, digits):
+    """Returns coords as a list of (x, y) integers in units of 10^-digits"""
+    scale = 10 ** digits
+    return [(int(round(pt[0] * scale)), int(round(pt[1] * scale)))
+            for pt in coords]
+
+
+def splitRings(coords):
+    """
+    Yields each ring in coords. A ring ends where it gets back to its
+    first point, which is how SA1-to-mbpt.py strings the rings of all
+    the mesh blocks in a division together.
+    """
+    start = 0
+    for k in range(1, len(coords)):
+        if k > start + 1 and coords[k] == coords[start]:
+            yield coords[start:k + 1]
+            start = k + 1
+    if len(coords) - start > 1:
+        yield coords[start:] + [coords[start]]
+
+
+def singleArea(doc):
+    """
+    Is doc one area's details rather than a name: details mapping?
+    austwide.py writes each territory that way.
+    """
+    return "coords" in doc
+
+
+def asElectorates(doc):
+    """Returns the JSON document doc as a name: details mapping"""
+    if singleArea(doc):
+        return {doc["jurisdiction"]: doc}
+    return doc
+
+
+def readElectorates(fnames):
+    """
+    Returns the electorates of all the files fnames as one name: details
+    mapping. Names are only unique within a file, so rather than let
+    one electorate quietly replace another we raise ValueError if a
+    name turns up in two files.
+    """
+    electorates = {}
+    origin = {}
+    for fname in fnames:
+        with open(fname, "r") as inf:
+            found = asElectorates(json.load(inf))
+        for ename in found:
+            if ename in origin:
+                raise ValueError("{0} is in both {1} and {2}".format(
+                    ename, origin[ename], fname))
+            origin[ename] = fname
+        electorates.update(found)
+    return electorates
+
+
+def findJunctions(lines):
+    """
+    Returns the set of points at which lines must be cut so that every
+    stretch shared by two or more lines becomes the same arc in each.
+    That's the ends of each line, plus any point which turns up with a
+    different pair of neighbours somewhere else.
+    """
+    neighbours = {}
+    junctions = set()
+    for line in lines:
+        if not line:
+            continue
+        junctions.add(line[0])
+        junctions.add(line[-1])
+        for k in range(1, len(line) - 1):
+            pair = frozenset((line[k - 1], line[k + 1]))
+            seen = neighbours.setdefault(line[k], pair)
+            if seen is not JUNCTION and seen != pair:
+                neighbours[line[k]] = JUNCTION
+                junctions.add(line[k])
+    return junctions
+
+
+def cutLine(line, junctions):
+    """Yields the arcs of line, cut at each of junctions"""
+    start = 0
+    for k in range(1, len(line)):
+        if line[k] in junctions:
+            yield tuple(line[start:k + 1])
+            start = k
+    if start == 0 and len(line) == 1:
+        yield tuple(line)
+
+
+def deltaEncode(arc):
+    """Returns arc as the flat list [x0, y0, dx1, dy1, ...]"""
+    flat = [arc[0][0], arc[0][1]]
+    for k in range(1, len(arc)):
+        flat.append(arc[k][0] - arc[k - 1][0])
+        flat.append(arc[k][1] - arc[k - 1][1])
+    return flat
+
+
+def deltaDecode(flat):
+    """Returns the list of (x, y) points of a delta encoded arc"""
+    points = []
+    x = y = 0
+    for k in range(0, len(flat), 2):
+        x += flat[k]
+        y += flat[k + 1]
+        points.append((x, y))
+    return points
+
+
+def encodeTopology(electorates, digits=DIGITS):
+    """
+    Returns the topology for electorates, a name: details mapping in
+    which each details has a "coords" list of [long, lat] points.
+    Everything else in details is carried across unchanged.
+    """
+    names = list(electorates)
+    lines = [quantise(electorates[ename]["coords"], digits)
+             for ename in names]
+    junctions = findJunctions(lines)
+
+    arcindex = {}
+    arcs = []
+    objects = {}
+    for ename, line in zip(names, lines):
+        refs = []
+        for arc in cutLine(line, junctions):
+            ref = arcindex.get(arc)
+            if ref is None:
+                ref = arcindex.get(arc[::-1])
+                if ref is not None:
+                    ref = ~ref
+            if ref is None:
+                ref = len(arcs)
+                arcindex[arc] = ref
+                arcs.append(deltaEncode(arc))
+            refs.append(ref)
+        details = dict((k, v) for (k, v) in electorates[ename].items()
+                       if k != "coords")
+        details["arcs"] = refs
+        objects[ename] = details
+
+    return {
+        "type": "Topology",
+        "digits": digits,
+        "arcs": arcs,
+        "objects": objects
+    }
+
+
+def decodeTopology(topo):
+    """
+    Returns the name: details mapping encoded in topo, with "coords"
+    in place of "arcs".
+    """
+    scale = 10 ** topo["digits"]
+    arcs = [deltaDecode(flat) for flat in topo["arcs"]]
+    electorates = {}
+    for ename, details in topo["objects"].items():
+        line = []
+        for ref in details["arcs"]:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            # consecutive arcs share their joining point
+            line.extend(arc[1:] if line else arc)
+        decoded = dict((k, v) for (k, v) in details.items() if k != "arcs")
+        decoded["coords"] = [[x / scale, y / scale] for (x, y) in line]
+        electorates[ename] = decoded
+    return electorates
+
+
+def writeTopology(outfn, electorates, digits=DIGITS):
+    """Writes the topology for electorates to outfn, compactly"""
+    with open(outfn, "w") as topof:
+        json.dump(encodeTopology(electorates, digits), topof,
+                  separators=(",", ":"))
+
+
+def readTopology(topofn):
+    """Returns the decoded name: details mapping from topofn"""
+    with open(topofn, "r") as topof:
+        return decodeTopology(json.load(topof))
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "dhq:")
+    dopts = dict(opts)
+
+    if "-h" in dopts or len(args) < 2:
+        usage()
+        sys.exit(0 if "-h" in dopts else 1)
+
+    if "-d" in dopts:
+        with open(args[0], "r") as inf:
+            topo = json.load(inf)
+        decoded = decodeTopology(topo)
+        if topo.get("single"):
+            decoded = list(decoded.values())[0]
+        with open(args[1], "w") as outf:
+            json.dump(decoded, outf)
+        sys.exit(0)
+
+    with open(args[0], "r") as inf:
+        electorates = json.load(inf)
+    single = singleArea(electorates)
+    electorates = asElectorates(electorates)
+    topo = encodeTopology(electorates, int(dopts.get("-q", DIGITS)))
+    if single:
+        topo["single"] = True
+    with open(args[1], "w") as outf:
+        json.dump(topo, outf, separators=(",", ":"))
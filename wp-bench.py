@@ -0,0 +1,236 @@
+#!/usr/bin/python3.5
+
+#
+# Copyright (c) 2018, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import gc
+import getopt
+import importlib.util
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+__USAGE = """
+Usage:
+
+wp-bench [-r repeats] [-j jobs,...] [-m] <archive directory>
+
+Times each stage of wp-to-rest.py over an archive directory (such as
+one generated by wp-synth.py) so that changes to the converter can be
+measured rather than guessed at:
+
+    discover    walking the tree with iter_posts()
+    parse       reading and parsing each page with parse_posts()
+    render      turning the parsed posts into reST with render_posts()
+    write       writing the reST files to a scratch directory
+
+Each stage is run `repeats` times (default 3) and the best time is
+reported, along with posts per second. With -m, each stage is run once
+more under tracemalloc to report its peak Python heap use.
+
+With -j, the whole of wp-to-rest.py is also run end to end as a
+subprocess at each of the comma-separated job counts, reporting wall
+time, posts per second and the peak RSS of the largest process in that
+run (wp-to-rest.py or one of its workers). These runs happen before the
+stages, so that our own memory use doesn't show up in theirs.
+"""
+
+__USAGE = __USAGE.strip()
+
+__doc__ = __USAGE
+
+WPTOREST = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "wp-to-rest.py")
+
+
+def load_wptorest():
+    """Import wp-to-rest.py, which cannot be imported by name"""
+    spec = importlib.util.spec_from_file_location("wp_to_rest", WPTOREST)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stage_discover(wtr, archive, _state):
+    """Lists every page in the archive"""
+    return list(wtr.iter_posts(archive, archive + "/"))
+
+
+def stage_parse(wtr, _archive, state):
+    """Parses every page"""
+    return [(slug, fname, wtr.parse_posts(fname))
+            for slug, fname in state["discover"]]
+
+
+def stage_render(wtr, _archive, state):
+    """Renders every parsed page to reST"""
+    outputs = []
+    for slug, fname, (heads, bodies, footers) in state["parse"]:
+        # As convert_file does, so the log doesn't grow across runs
+        del wtr._messages[:]
+        outputs.extend(wtr.render_posts(slug, fname, "+0000",
+                                        heads, bodies, footers))
+    return outputs
+
+
+def stage_write(_wtr, _archive, state):
+    """Writes every rendered post to a scratch directory"""
+    outdir = tempfile.mkdtemp(prefix="wp-bench-")
+    try:
+        for outfn, text in state["render"]:
+            with open(os.path.join(outdir, outfn), "w") as outf:
+                outf.write(text)
+    finally:
+        shutil.rmtree(outdir)
+    return state["render"]
+
+
+STAGES = [
+    ("discover", stage_discover),
+    ("parse", stage_parse),
+    ("render", stage_render),
+    ("write", stage_write)
+]
+
+
+def time_stage(func, wtr, archive, state, repeats):
+    """Returns (best seconds, result) over repeats runs of func"""
+    best = None
+    for _run in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(wtr, archive, state)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def heap_peak(func, wtr, archive, state):
+    """Returns the peak traced Python heap, in KiB, of one run of func"""
+    gc.collect()
+    tracemalloc.start()
+    func(wtr, archive, state)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak // 1024
+
+
+def bench_stages(archive, repeats, memory):
+    """Times each stage of the conversion in this process"""
+    wtr = load_wptorest()
+    wtr.set_url_rules(wtr.DEFAULT_URL_RULES)
+    wtr.set_asset_root(None)
+    state = {}
+    nposts = 0
+    print("{0:<10} {1:>10} {2:>12}{3}".format(
+        "stage", "seconds", "posts/s", "   peak KiB" if memory else ""))
+    for name, func in STAGES:
+        elapsed, state[name] = time_stage(func, wtr, archive, state,
+                                          repeats)
+        if name == "parse":
+            nposts = sum(len(bodies) for _s, _f, (_h, bodies, _f2)
+                         in state[name])
+        peak = ""
+        if memory:
+            peak = " {0:>10}".format(heap_peak(func, wtr, archive, state))
+        rate = "{0:>12.1f}".format(nposts / elapsed) if nposts and elapsed \
+            else "{0:>12}".format("-")
+        print("{0:<10} {1:>10.3f} {2}{3}".format(name, elapsed, rate, peak))
+    print("{0} pages, {1} posts; peak RSS of this process {2} KiB".format(
+        len(state["discover"]), nposts,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    return nposts
+
+
+def run_jobs(archive, jobcounts):
+    """
+    Runs wp-to-rest.py end to end once per job count, returning a list
+    of (jobs, seconds, peak RSS KiB). A child's ru_maxrss starts from
+    whatever its parent's was when it forked, so this has to run before
+    we load the converter and parse anything ourselves.
+    """
+    runs = []
+    for jobs in jobcounts:
+        outdir = tempfile.mkdtemp(prefix="wp-bench-")
+        cmd = [sys.executable, WPTOREST, "-f", "-j", str(jobs), ".", outdir]
+        try:
+            start = time.perf_counter()
+            proc = subprocess.Popen(cmd, cwd=archive,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL)
+            # wait4() gives us the rusage of just this run: its ru_maxrss
+            # is the largest of wp-to-rest.py and the workers it reaped,
+            # where RUSAGE_CHILDREN would be the largest of any run so far.
+            _pid, status, rusage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(outdir)
+        if os.WIFEXITED(status):
+            proc.returncode = os.WEXITSTATUS(status)
+        else:
+            proc.returncode = -os.WTERMSIG(status)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        runs.append((jobs, elapsed, rusage.ru_maxrss))
+    return runs
+
+
+def bench_jobs(runs, nposts):
+    """Reports the end to end runs from run_jobs"""
+    print("\n{0:>5} {1:>10} {2:>12} {3:>14}".format(
+        "jobs", "seconds", "posts/s", "child RSS KiB"))
+    for jobs, elapsed, childrss in runs:
+        print("{0:>5} {1:>10.3f} {2:>12.1f} {3:>14}".format(
+            jobs, elapsed, nposts / elapsed, childrss))
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "hj:mr:")
+    dopts = dict(opts)
+    if "-h" in dopts or len(args) < 1:
+        print(__USAGE)
+        sys.exit(0 if "-h" in dopts else 1)
+
+    archive = os.path.abspath(args[0])
+    repeats = int(dopts.get("-r", 3))
+
+    runs = []
+    if "-j" in dopts:
+        runs = run_jobs(archive,
+                        [int(jobs) for jobs in dopts["-j"].split(",")])
+    nposts = bench_stages(archive, repeats, "-m" in dopts)
+    if runs:
+        bench_jobs(runs, nposts)
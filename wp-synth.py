@@ -0,0 +1,294 @@
+#!/usr/bin/python3.5
+
+#
+# Copyright (c) 2018, James C. McPherson. All Rights Reserved.
+#
+
+# Available under the terms of the MIT license:
+#
+# Permission is hereby granted, free of charge, to any
+# person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the
+# Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice
+# shall be included in all copies or substantial portions of
+# the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS
+# OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import getopt
+import os
+import random
+import sys
+
+from xml.sax.saxutils import escape
+
+
+__USAGE = """
+Usage:
+
+wp-synth [-n posts] [-p posts-per-page] [-b blocks] [-s seed]
+         [-x boilerplate-kb] [-u site-url] [-w export.xml] <output directory>
+
+Generates a synthetic WordPress-style archive for exercising and
+benchmarking wp-to-rest.py, without needing anybody's real blog.
+
+Each archive page is written to <output directory>/YYYY/MM/DD/slug/
+index.html, and holds posts-per-page posts (default 1) each made of a
+post-headline, post-bodycopy and post-footer div, surrounded by about
+boilerplate-kb of sidebar, navigation, script and comment markup
+(default 20). Each post body has around `blocks` (default 12) blocks of
+paragraphs with links and inline markup, tables, pre blocks, images,
+nested lists, blockquotes and headings. Footers alternate between the
+old style (with a comments link giving the slug) and the new style.
+Every third post uses the Atahualpa theme's markup instead, where the
+post divs carry extra classes ("post-bodycopy clearfix") and sit inside
+a wrapper div of their own.
+
+wp-to-rest.py takes each post's date from its directory path, so
+convert the archive from inside the output directory:
+
+    cd <output directory> && wp-to-rest.py . <rest directory>
+
+With -w, the same posts are also written as a WXR export.
+
+The output depends only on the arguments, so a given seed (default 1)
+always produces the same archive.
+"""
+
+__USAGE = __USAGE.strip()
+
+__doc__ = __USAGE
+
+WORDS = ("solaris zfs kernel driver storage network python build release "
+         "compiler test fault service boot disk pool zone link image "
+         "package update patch debug trace probe").split()
+
+PAGE_TMPL = """<!DOCTYPE html>
+<html><head><title>{title}</title>
+<script type="text/javascript">{script}</script>
+<link rel="stylesheet" href="/wp-content/themes/x/style.css" />
+</head><body>
+<div id="header"><ul class="nav">{nav}</ul></div>
+<div id="content">
+{posts}
+</div>
+<div id="sidebar">{sidebar}</div>
+<div id="comments">{comments}</div>
+</body></html>
+"""
+
+POST_TMPL = """<div class="post-headline"><h2>{title}</h2></div>
+<div class="post-bodycopy">
+{body}
+</div>
+{footer}
+"""
+
+ATAHUALPA_POST_TMPL = """<div class="post" id="post-{postid}">
+<div class="post-headline entry-title"><h2>{title}</h2></div>
+<div class="post-bodycopy clearfix">
+{body}
+</div>
+{footer}
+</div>
+"""
+
+OLD_FOOTER_TMPL = ('<div class="post-footer">Posted in {cats} | '
+                   '<a class="comments-link" href="{site}/blog/{date}/'
+                   '{slug}/#comments">Comments</a></div>')
+
+NEW_FOOTER_TMPL = '<div class="post-footer">Posted in {cats}</div>'
+
+WXR_HEAD = """<?xml version="1.0" encoding="UTF-8" ?>
+<rss version="2.0"
+  xmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"
+  xmlns:content="http://purl.org/rss/1.0/modules/content/"
+  xmlns:dc="http://purl.org/dc/elements/1.1/"
+  xmlns:wp="http://wordpress.org/export/1.2/">
+<channel>
+<title>Synthetic blog</title>
+<wp:wxr_version>1.2</wp:wxr_version>
+"""
+
+WXR_ITEM_TMPL = """<item>
+<title>{title}</title>
+<content:encoded><![CDATA[{body}]]></content:encoded>
+<excerpt:encoded><![CDATA[]]></excerpt:encoded>
+<wp:post_id>{postid}</wp:post_id>
+<wp:post_date><![CDATA[{date} 10:00:00]]></wp:post_date>
+<wp:post_date_gmt><![CDATA[{date} 00:00:00]]></wp:post_date_gmt>
+<wp:post_name><![CDATA[{slug}]]></wp:post_name>
+<wp:status><![CDATA[publish]]></wp:status>
+<wp:post_type><![CDATA[post]]></wp:post_type>
+{cats}
+</item>
+"""
+
+
+def words(rnd, count):
+    return " ".join(rnd.choice(WORDS) for _i in range(count))
+
+
+def upload(site, rnd):
+    return "{0}/blog/wp-content/uploads/{1}/{2:02d}/{3}.png".format(
+        site, rnd.randint(2008, 2019), rnd.randint(1, 12), words(rnd, 1))
+
+
+def para(rnd, site):
+    return ('<p>{0} <b>{1}</b> {2} <i>{3}</i> <tt>{4}</tt> <a href="{5}/blog/'
+            '{6}/">{7}</a> {8}.</p>'.format(
+                words(rnd, 8), words(rnd, 2), words(rnd, 6), words(rnd, 2),
+                words(rnd, 1), site, rnd.randint(2008, 2019),
+                words(rnd, 3), words(rnd, 10)))
+
+
+def table(rnd, site):
+    ncols = rnd.randint(2, 5)
+    rows = ["<tr>" + "".join("<th>{0}</th>".format(words(rnd, 1))
+                             for _c in range(ncols)) + "</tr>"]
+    for _r in range(rnd.randint(2, 20)):
+        cells = [words(rnd, rnd.randint(1, 3)) for _c in range(ncols)]
+        cells[-1] = '<a href="{0}">{1}</a>'.format(upload(site, rnd),
+                                                   cells[-1])
+        rows.append("<tr>" + "".join("<td>{0}</td>".format(c)
+                                     for c in cells) + "</tr>")
+    return "<table>\n" + "\n".join(rows) + "\n</table>"
+
+
+def pre(rnd, site):
+    return "<pre>" + "\n".join(
+        "{0}({1}) &lt;= {2};".format(words(rnd, 1), words(rnd, 2),
+                                     rnd.randint(0, 999))
+        for _l in range(rnd.randint(3, 40))) + "</pre>"
+
+
+def image(rnd, site):
+    return ('<img src="{0}" width="{1}" height="{2}" alt="{3}" />'.format(
+        upload(site, rnd), rnd.randint(100, 800), rnd.randint(100, 600),
+        words(rnd, 3)))
+
+
+def nested_list(rnd, site, depth=0):
+    items = []
+    for _i in range(rnd.randint(2, 6)):
+        item = words(rnd, rnd.randint(2, 8))
+        if depth < 2 and rnd.random() < 0.3:
+            item += nested_list(rnd, site, depth + 1)
+        items.append("<li>{0}</li>".format(item))
+    tag = rnd.choice(("ul", "ol"))
+    return "<{0}>\n{1}\n</{0}>".format(tag, "\n".join(items))
+
+
+def blockquote(rnd, site):
+    return "<blockquote>{0}\n<i>{1}</i></blockquote>".format(
+        words(rnd, 12), words(rnd, 4))
+
+
+def heading(rnd, site):
+    return "<h3>{0}</h3>".format(words(rnd, 3))
+
+
+# (weight, generator) for the blocks of a post body
+BLOCKS = [
+    (40, para), (10, table), (10, pre), (10, image), (12, nested_list),
+    (8, blockquote), (10, heading)
+]
+
+
+def body(rnd, site, nblocks):
+    total = sum(weight for weight, _gen in BLOCKS)
+    parts = []
+    for _b in range(max(1, int(rnd.gauss(nblocks, nblocks / 4.0)))):
+        pick = rnd.uniform(0, total)
+        for weight, gen in BLOCKS:
+            pick -= weight
+            if pick <= 0:
+                break
+        parts.append(gen(rnd, site))
+    return "\n".join(parts)
+
+
+def boilerplate(rnd, kbytes):
+    links = "".join('<li><a href="/tag/{0}/">{0}</a></li>'.format(
+        words(rnd, 1)) for _i in range(max(1, kbytes * 1024 // 80)))
+    return links
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "b:hn:p:s:u:w:x:")
+    dopts = dict(opts)
+    if "-h" in dopts or len(args) < 1:
+        print(__USAGE)
+        sys.exit(0 if "-h" in dopts else 1)
+
+    nposts = int(dopts.get("-n", 100))
+    perpage = int(dopts.get("-p", 1))
+    nblocks = int(dopts.get("-b", 12))
+    kbytes = int(dopts.get("-x", 20))
+    site = dopts.get("-u", "http://www.jmcpdotcom.com")
+    rnd = random.Random(int(dopts.get("-s", 1)))
+    outdir = args[0]
+
+    wxrf = None
+    if "-w" in dopts:
+        wxrf = open(dopts["-w"], "w")
+        wxrf.write(WXR_HEAD)
+
+    written = 0
+    for pageno in range((nposts + perpage - 1) // perpage):
+        posts = []
+        for postno in range(pageno * perpage,
+                            min(nposts, (pageno + 1) * perpage)):
+            date = "{0}/{1:02d}/{2:02d}".format(
+                2008 + postno % 12, postno % 12 + 1, postno % 28 + 1)
+            slug = "post-{0}-{1}".format(postno, words(rnd, 1))
+            title = "{0} {1}".format(words(rnd, 4).title(), postno)
+            cats = [words(rnd, 1).title() for _c in range(rnd.randint(1, 3))]
+            postbody = body(rnd, site, nblocks)
+            catlinks = ", ".join(
+                '<a href="/category/{0}/" rel="category tag">{0}</a>'.format(
+                    cat) for cat in cats)
+            tmpl = OLD_FOOTER_TMPL if postno % 4 else NEW_FOOTER_TMPL
+            posttmpl = ATAHUALPA_POST_TMPL if postno % 3 == 2 else POST_TMPL
+            posts.append(posttmpl.format(
+                postid=postno + 1, title=title, body=postbody,
+                footer=tmpl.format(
+                    cats=catlinks, site=site, date=date, slug=slug)))
+            if wxrf:
+                wxrf.write(WXR_ITEM_TMPL.format(
+                    title=escape(title), body=postbody, postid=postno + 1,
+                    date=date.replace("/", "-"), slug=slug,
+                    cats="\n".join(
+                        '<category domain="category" nicename="{0}">'
+                        '<![CDATA[{1}]]></category>'.format(
+                            cat.lower(), cat) for cat in cats)))
+        pagedir = os.path.join(outdir, date, slug)
+        os.makedirs(pagedir, exist_ok=True)
+        with open(os.path.join(pagedir, "index.html"), "w") as pagef:
+            pagef.write(PAGE_TMPL.format(
+                title=title, script="var x = 1;\n" * (kbytes * 4),
+                nav=boilerplate(rnd, kbytes // 4),
+                posts="\n".join(posts),
+                sidebar=boilerplate(rnd, kbytes // 2),
+                comments=boilerplate(rnd, kbytes // 4)))
+        written += 1
+
+    if wxrf:
+        wxrf.write("</channel>\n</rss>\n")
+        wxrf.close()
+    print("wrote {0} posts in {1} pages under {2}".format(
+        nposts, written, outdir))
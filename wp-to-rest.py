@@ -30,17 +30,29 @@
 
 
 import bs4
+import collections
+import datetime
+import functools
 import getopt
+import hashlib
+import json
 import os
 import re
+import shutil
 import sys
 import time
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
 
 __USAGE = """
 Usage:
 
-wp-to-rest <directory tree to process> <output directory>
+wp-to-rest [-j N | --jobs N] [-f | --force] [-r rules | --rules rules]
+           [-a dir | --assets dir] [-l | --link]
+           <directory tree or WXR export to process> <output directory>
 
 This is a very simple script which aims to turn WordPress posts
 into reST-formatted documents suitable to importing into a blog
@@ -49,6 +61,39 @@ engine such as Nikola or Pelican.
 This tool operates on a BEST EFFORT basis - each translated file
 mst be checked for accuracy prior to use with a blog engine.
 
+If given a file rather than a directory tree, we read it as a WordPress
+WXR export (Tools -> Export) in a single pass, one <item> at a time.
+The title, date, categories, tags, slug and body of each published post
+come straight from the export's fields.
+
+With --jobs N the files are converted across N worker processes. The
+output, and the order of the log messages, are the same as for a serial
+run.
+
+A manifest of what was converted (.wp-to-rest-manifest.json, in the
+output directory) records the size, mtime and SHA-256 of each source
+file along with the .rst files it produced. Later runs skip sources
+which haven't changed, and remove the output of sources which have
+gone away. Use --force to convert everything again.
+
+URLs in links, images and tables are rewritten by a set of prefix rules.
+By default these turn the author's old jmcpdotcom.com URLs into local
+ones; with --rules the rules are read from a file instead, one
+"prefix [replacement]" per line, with '#' starting a comment. The
+rules are applied in order, each to the result of the ones before, so
+a rule can rewrite what an earlier one produced (the default rollerhttp
+rule relies on this).
+
+With --assets, image references (after URL rewriting) are looked up as
+files under the given directory, normally your wp-content/uploads. Each
+image which is found is stored once in the images/ directory of the
+output, named by its SHA-256, and the posts refer to it there. Images
+are copied, or hardlinked with --link, concurrently at the end of the
+run, and images which an earlier run placed but no post uses any more
+are removed; anything else in images/ is left alone. Incremental runs
+only notice changed posts, not changed images; use --force after
+replacing an image.
+
 It works for me, but you might need to hack on it for your purposes.
 """
 
@@ -79,39 +124,155 @@ METADATA_TMPL="""
 .. category: {4}\n
 """
 
+WXR_METADATA_TMPL="""
+.. title: {0}
+.. slug: {5}
+.. date: {1} {2}
+.. tags: {3}
+.. category: {4}\n
+"""
+
+# The <item> children we want from a WXR export, by local name
+WXR_FIELDS = set(["title", "encoded", "post_id", "post_date",
+                  "post_date_gmt", "post_name", "status", "post_type"])
+WXR_DATE = "%Y-%m-%d %H:%M:%S"
+
 URL_TMPL=".. _{0}: {1}\n"
 IMG_TMPL="\n.. image:: {0}\n"
 PRE_TMPL="\n.. code-block::\n    "
 
+MANIFEST_NAME = ".wp-to-rest-manifest.json"
+
+# Themes such as Atahualpa add more classes, eg "post-bodycopy clearfix"
+POST_STRAINER = bs4.SoupStrainer("div", attrs={"class": re.compile(
+    r"(^|\s)post-(headline|bodycopy|footer)($|\s)")})
+
+# The rules urlreplace applies unless we're given a rules file (-r).
+DEFAULT_URL_RULES = [
+    ("http://www.jmcpdotcom.com/rollerhttp", "http"),
+    ("http://www.jmcpdotcom.com/blog/wp-content/uploads", ""),
+    ("http://www.jmcpdotcom.com/blog/wp-includes", ""),
+    ("http://www.jmcpdotcom.com/wordpress/3.3/wp-content/uploads", "")
+]
+
+# (prefix, replacement) pairs, applied in order by urlreplace
+_url_rules = []
+
+# Content-addressed images go in here, within the output directory
+ASSET_DIR = "images"
+
+# Where referenced images are looked for (--assets), see resolve_asset()
+_asset_root = None
+
+# Images used by the file currently being converted, name: source path
+_assets = {}
+
+# Messages for the file currently being converted, see convert_file()
+_messages = []
+
+
+def log(msg):
+    """Queues msg to be printed once the current file is done"""
+    _messages.append(msg)
+
+
+
+def read_url_rules(rulesfn):
+    """
+    Reads URL rewrite rules from rulesfn. Each non-blank line which
+    doesn't start with '#' holds a URL prefix and, optionally, what to
+    replace it with, separated by whitespace. Returns a list of
+    (prefix, replacement) pairs.
+    """
+    rules = []
+    with open(rulesfn, "r") as rulesf:
+        for line in rulesf:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(None, 1)
+            rules.append((parts[0], parts[1] if len(parts) > 1 else ""))
+    return rules
+
+
+def set_url_rules(rules):
+    """Sets the rules used by urlreplace, a list of (prefix, replacement)"""
+    _url_rules[:] = [tuple(rule) for rule in rules]
+    rewrite_url.cache_clear()
 
 
 def urlreplace(instr):
-    instr = instr.replace("http://www.jmcpdotcom.com/rollerhttp", "http")
-    instr = instr.replace("http://www.jmcpdotcom.com/blog/wp-content/uploads",
-                          "")
-    instr = instr.replace("http://www.jmcpdotcom.com/blog/wp-includes",
-                          "")
-    instr = instr.replace(
-        "http://www.jmcpdotcom.com/wordpress/3.3/wp-content/uploads",
-        "")
+    """
+    Applies each URL rewrite rule to instr in turn, so that later rules
+    see what earlier ones produced.
+    """
+    for prefix, replacement in _url_rules:
+        instr = instr.replace(prefix, replacement)
     return instr
 
 
-def handle_img(tag):
-    imgdecl = IMG_TMPL.format(tag.get("src"))
-    imgdecl = urlreplace(imgdecl)
+@functools.lru_cache(maxsize=1 << 16)
+def rewrite_url(url):
+    """
+    urlreplace for one URL or table cell; posts link to the same places
+    a lot, and tables repeat their cells.
+    """
+    return urlreplace(url)
+
+
+# The renderer appends its output to a single list, `out`, which the
+# caller joins once at the end. Each handler takes the tag and `out`;
+# handlers for new tags go in TAG_HANDLERS (exact names) or
+# TAG_PREFIXES (tag names starting with the given prefix).
+
+
+def set_asset_root(root):
+    """Sets the directory which image references are looked up in"""
+    global _asset_root
+    _asset_root = root
+    resolve_asset.cache_clear()
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def resolve_asset(src):
+    """
+    Returns (asset name, source path) for the image src, or None if
+    it isn't a file under the asset root. The asset name is the image's
+    SHA-256 plus its extension, so each distinct image is stored once
+    however many times, and under whatever names, it is used.
+    """
+    if _asset_root is None or "://" in src:
+        return None
+    relpath = unquote(src.split("?")[0].split("#")[0]).lstrip("/")
+    path = os.path.normpath(os.path.join(_asset_root, relpath))
+    if os.path.commonpath([_asset_root, path]) != _asset_root or \
+       not os.path.isfile(path):
+        return None
+    return file_digest(path)[:32] + os.path.splitext(path)[1].lower(), path
+
+
+def handle_img(tag, out):
+    src = tag.get("src")
+    if src:
+        src = rewrite_url(src)
+        asset = resolve_asset(src)
+        if asset:
+            _assets[asset[0]] = asset[1]
+            src = "/{0}/{1}".format(ASSET_DIR, asset[0])
+        elif _asset_root is not None:
+            log("\timage {0} not found under {1}".format(src, _asset_root))
+    out.append(IMG_TMPL.format(src))
     if tag.get("height"):
-        imgdecl += ("    :height: {0}\n".format(tag.get("height")))
+        out.append("    :height: {0}\n".format(tag.get("height")))
     if tag.get("width"):
-        imgdecl += ("    :width: {0}\n".format(tag.get("width")))
+        out.append("    :width: {0}\n".format(tag.get("width")))
     if tag.get("alt"):
-        imgdecl += ("    :alt: {0}\n".format(tag.get("alt")))
+        out.append("    :alt: {0}\n".format(tag.get("alt")))
     if tag.get("title"):
-        print("\timage ref {0} has 'title' when it should just have 'alt'".
-              format(tag.get("src")))
-    imgdecl += "\n"
-    return imgdecl
-                       
+        log("\timage ref {0} has 'title' when it should just have 'alt'".
+            format(tag.get("src")))
+    out.append("\n")
+
 
 def handle_thtd(tdata):
     cells = []
@@ -121,146 +282,163 @@ def handle_thtd(tdata):
                 cells.append(tdel)
         else:
             cells.append(tags_r(tdel))
-    #print("\tcalled with {0}\n\treturning {1}\n".format(tdata, cells))
     return cells
 
 
-def format_thtd(cells, celltype):
+def format_thtd(cells, celltype, out):
     # Called on a per-row basis
-    outstr = ""
     # Handle the top of the table, key off whether we're given '='
     # for celltype.
-    if celltype is "=":
-        outstr += "+"
-        for col in cells:
-            outstr += '-' * (len(col) + 2) + "+"
-        outstr += "\n"
-    tstr = "| "
-    lstr = "+"
-    for col in cells:
-        tstr += col + " | "
-        lstr += celltype * (len(col) + 2) + "+"
-    tstr += "\n"
-    tstr = urlreplace(tstr)
-    lstr += "\n"
-    outstr += tstr
-    outstr += lstr
-    return(outstr)
-
-
-
-
-
-def handle_table(tag):
-    allrows = []
-    restr = ""
+    if celltype == "=":
+        out.append("+" + "".join('-' * (len(col) + 2) + "+"
+                                 for col in cells) + "\n")
+    out.append("| " + "".join(rewrite_url(col) + " | " for col in cells) +
+               "\n")
+    out.append("+" + "".join(celltype * (len(col) + 2) + "+"
+                             for col in cells) + "\n")
+
+
+def table_rows(tag):
+    """Yields the rows of tag, looking inside any thead/tbody/tfoot"""
     for jk in tag.children:
-        #print(jk.name)
-        if not jk.name or jk.name is "tbody":
-            #print("skipping tbody")
+        if not jk.name:
             continue
-        if not isinstance(jk, bs4.element.NavigableString):
-            allrows.append(handle_thtd(jk))
-    retstr = format_thtd(allrows[0], "=")
-    for _l in range(1, len(allrows)):
-        retstr += format_thtd(allrows[_l], "-")
-    return retstr
+        if jk.name in ("thead", "tbody", "tfoot"):
+            yield from table_rows(jk)
+        else:
+            yield jk
+
 
+def handle_table(tag, out):
+    allrows = [handle_thtd(row) for row in table_rows(tag)]
+    for idx, cells in enumerate(allrows):
+        format_thtd(cells, "=" if idx == 0 else "-", out)
+    out.append("\n")
 
-            
-def handle_pre(tag):
-    predecl = PRE_TMPL
+
+def handle_pre(tag, out):
+    out.append(PRE_TMPL)
     for line in tag.contents:
         if isinstance(line, bs4.element.Tag):
             if not line.is_empty_element:
-                predecl += tags_r(line)
+                emit_children(line, out)
         else:
-            predecl += line.replace("\n", "\n    ")
-    predecl += "\n\n"
-    return predecl
+            out.append(line.replace("\n", "\n    "))
+    out.append("\n\n\n")
 
 
-def handle_blockquote(tag):
-    line = "::\n  "
+def handle_blockquote(tag, out):
+    out.append("::\n  ")
     for el in tag.contents:
         if isinstance(el, bs4.element.Tag):
-            line += tags_r(el)
+            emit_children(el, out)
+        else:
+            out.append(el + "\n  ")
+    out.append("\n")
+
+
+def handle_a(tag, out):
+    out.append("`")
+    emit_children(tag, out)
+    out.append("`_\\ ")
+
+
+def handle_h1(tag, out):
+    outstr = "".join(tag.contents)
+    out.append("\n" + outstr + "\n" + '=' * len(outstr))
+
+
+def handle_h2(tag, out):
+    # We need the rendered length for the underline
+    outstr = tags_r(tag)
+    out.append("\n" + outstr + "\n" + '-' * len(outstr))
+
+
+def handle_div(tag, out):
+    log("\tGot a <div> with attrs {0}".format(tag.attrs))
+
+
+def handle_font(tag, out):
+    # reST has no colours or faces, and <font> sits inside paragraphs
+    # where a raw block can't go, so we keep just what it wraps
+    emit_children(tag, out)
+
+
+def wrap(before, after):
+    """Returns a handler which emits tag's children between before/after"""
+    def handler(tag, out):
+        out.append(before)
+        emit_children(tag, out)
+        out.append(after)
+    return handler
+
+
+def handle_unknown(tag, out):
+    log("\tunknown tag name: {0}".format(tag.name))
+    log("\ttag contents:\n{0}".format(tag.contents))
+    emit_children(tag, out)
+
+
+TAG_HANDLERS = {
+    "br": lambda tag, out: None,
+    "blockquote": handle_blockquote,
+    "tt": wrap("``", "``"),
+    "it": wrap("*", "*"),
+    "i": wrap("*", "*"),
+    "b": wrap("**", "**"),
+    "strong": wrap("**", "**"),
+    "ul": wrap("\n", ""),
+    "li": wrap("\n  - ", ""),
+    "ol": wrap("\n", ""),
+    "hr": lambda tag, out: out.append("\n........ \n"),
+    "h1": handle_h1,
+    "h2": handle_h2,
+    "h3": handle_h2,
+    "p": wrap("\n", "\n"),
+    "div": handle_div,
+    "table": handle_table,
+    "font": handle_font
+}
+
+# Checked in order, for names which aren't in TAG_HANDLERS
+TAG_PREFIXES = [
+    ("img", handle_img),
+    ("a", handle_a),
+    ("pre", handle_pre),
+    ("code", handle_pre)
+]
+
+
+def find_handler(name):
+    """Looks up (and remembers) the handler for tags called name"""
+    handler = TAG_HANDLERS.get(name)
+    if handler is None:
+        handler = handle_unknown
+        for prefix, prefhandler in TAG_PREFIXES:
+            if name.startswith(prefix):
+                handler = prefhandler
+                break
+        TAG_HANDLERS[name] = handler
+    return handler
+
+
+def emit_children(arg, out):
+    """Renders the children of arg as reST, appending to out"""
+    for el in arg.contents:
+        if isinstance(el, bs4.element.NavigableString):
+            out.append(el.strip("\n"))
         else:
-            line += el + "\n  "
-    line += "\n"
-    return line
+            find_handler(el.name)(el, out)
 
 
-def handle_a(tag):
-    retstr = ""
-    if isinstance(tag, bs4.element.NavigableString):
-        retstr += tag
-    else:
-        retstr = tags_r(tag)
-    url = "`{0}`_\ ".format(retstr)
-    return url
+def tags_r(arg):
+    """Returns the children of arg rendered as reST"""
+    out = []
+    emit_children(arg, out)
+    return "".join(out)
 
 
-def tags_r(arg):
-    retstr = ""
-    for el in arg.contents:
-        if isinstance(el, bs4.element.NavigableString) and len(el) > 0:
-            retstr += el.strip("\n")
-        elif el.__dict__['name'] == "br":
-            continue
-        elif el.__dict__['name'] == "blockquote":
-            retstr += handle_blockquote(el)
-        elif el.__dict__['name'].startswith("img"):
-            retstr += handle_img(el)
-        elif el.__dict__['name'].startswith("a"):
-            retstr += handle_a(el)
-        elif el.__dict__['name'] == "tt":
-            retstr += "``" + tags_r(el) + "``"
-        elif el.__dict__['name'] == "it" or el.__dict__['name'] == "i":
-            retstr += "*"  + tags_r(el) + "*"
-        elif el.__dict__['name'] == "b" or el.__dict__['name'] == "strong":
-            retstr += "**"  + tags_r(el) + "**"
-        elif el.__dict__['name'] == "ul":
-            retstr += "\n" + tags_r(el)
-        elif el.__dict__['name'] == "li":
-            retstr += "\n  - " + tags_r(el)
-        elif el.__dict__['name'] == "ol":
-            retstr += "\n" + tags_r(el)
-        elif el.__dict__['name'] == "hr":
-            retstr += "\n........ \n" 
-        elif el.__dict__['name'] == "h1":
-            outstr = "".join(el.contents)
-            retstr += "\n" + outstr
-            retstr += "\n" + '=' * len(outstr)
-        elif el.__dict__['name'] == "h2" or el.__dict__['name'] == "h3":
-            outstr = ""
-            if not isinstance(el, bs4.element.NavigableString):
-                outstr += tags_r(el)
-            else:
-                #print(type(el))
-                outstr += el.strip("\n")
-            retstr += "\n" + outstr
-            retstr += "\n" + '-' * len(outstr)
-        elif el.__dict__['name'] == "p":
-            retstr += "\n"
-            retstr += tags_r(el)
-            retstr += "\n"
-        elif el.__dict__['name'] == "div":
-            print("\tGot a <div> with attrs {0}".format(el.attrs))
-        elif el.__dict__['name'] == "table":
-            retstr += handle_table(el)
-            retstr += "\n"
-        elif el.__dict__['name'].startswith("pre") or \
-             el.__dict__['name'].startswith("code"):
-            retstr += handle_pre(el)
-            retstr += "\n"
-        elif el.__dict__['name'] == "font":
-            retstr += "\n.. raw:: html\n" + el.contents + "\n"
-        else:
-            print("\tunknown tag name: {0}".format(el.__dict__['name']))
-            print("\ttag contents:\n{0}".format(el.contents))
-            retstr += tags_r(el)
-    return retstr
+set_url_rules(DEFAULT_URL_RULES)
 
 
 def get_other_meta(footer):
@@ -293,100 +471,451 @@ def get_post_title(post_head):
     return title.replace("\n", "").replace("\t", "")
 
 
-def get_list_of_posts(startdir, strippath):
+def iter_posts(startdir, strippath):
     """
-    Returns a dict of {slugified-post-title: filename} to work on. If
-    strippath is not None, then we remove every strippath from the
-    slugified entry.
+    Generator which yields (slug, filename) for every file under
+    startdir, directory by directory in os.walk order, as soon as each
+    directory has been read. The slug is the directory path with '/'
+    turned into '-', plus the file's basename if the directory holds
+    more than one file. If strippath is not None, then we remove every
+    strippath from the slug.
     """
-    postlist = {}
-    for dirname, _dirs, fname in os.walk(startdir):
-        if len(fname) > 0:
-            dirk = dirname
-            if strippath:
-                dirk = dirk.replace(strippath, "")
-            dirk = dirk.replace("/", "-")
-            for i in fname:
-                postlist[dirk] = os.path.join(dirname, i)
-    return postlist
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(startdir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                else:
+                    files.append(entry)
+    except OSError as _exc:
+        return
+
+    dirk = startdir
+    if strippath:
+        dirk = dirk.replace(strippath, "")
+    dirk = dirk.replace("/", "-")
+    for entry in files:
+        if len(files) == 1:
+            yield dirk, entry.path
+        else:
+            yield dirk + "-" + os.path.splitext(entry.name)[0], entry.path
+    for subdir in subdirs:
+        yield from iter_posts(subdir, strippath)
 
 
+def render_body(body):
+    """
+    Returns the reST for the post body (a Tag), followed by the targets
+    of the links it contains.
+    """
+    # Get our list of hrefs
+    post_hrefs = {}
+    for ref in body.findAll("a"):
+        #print(ref.__dict__)
+        if ref.has_attr('id'):
+            post_hrefs[ref['id']] = ref.text
+        else:
+            post_hrefs[ref.text] = ref['href']
+    outstr = tags_r(body)
+    urlblock = "".join(URL_TMPL.format(k, rewrite_url(post_hrefs[k]))
+                       for k in post_hrefs)
+    return outstr + "\n" + urlblock
+
+
+def parse_posts(fname):
+    """
+    Parses fname, returning the lists of post-headline, post-bodycopy
+    and post-footer divs.
+    """
+    # Only the post divs get built into the soup; the sidebars, comments,
+    # scripts and navigation are skipped by the parser.
+    with open(fname, "r") as inf:
+        soup = bs4.BeautifulSoup(inf, "html.parser", parse_only=POST_STRAINER)
+    # How many posts do we have in this file? Make the assumption that
+    # they're in associated order. We rely on the human to check this.
+    post_heads = soup.find_all(name="div", attrs={"class": "post-headline"})
+    post_bodies = soup.find_all(name="div", attrs={"class": "post-bodycopy"})
+    post_footers = soup.find_all(name="div", attrs={"class": "post-footer"})
+    return post_heads, post_bodies, post_footers
+
+
+def render_posts(slug, fname, utcoff, post_heads, post_bodies, post_footers):
+    """
+    Renders the posts parsed from fname, returning a list of (output
+    filename, reST text).
+    """
+    outputs = []
+    if len(post_heads) != len(post_bodies) or len(post_heads) != len(post_footers) \
+       or len(post_bodies) != len(post_footers):
+        # urg
+        log("Differing numbers of headers, bodies and footers in {0}.\n"
+            "Manual pre-processing required, sorry\n".format(fname))
+        log("headers: {0}\n{1}\n----\n # bodies {2}\n----\nfooters: {3}\n{4}".format(
+            len(post_heads), post_heads, len(post_bodies),
+            len(post_footers), [j for footer in post_footers
+                                for j in footer.findAll("a", {"class":"comments-link"})]))
+        return outputs
+    for idx in range(len(post_heads)):
+        title = get_post_title(post_heads[idx])
+        log("\tidx {0} has title :: {1}".format(idx, title))
+        outstr = render_body(post_bodies[idx])
+        categories, slugfn, pubdate = get_other_meta(post_footers[idx])
+        if slugfn is None:
+            # new-style footer, have to use a different approach
+            pubdate = slug[0:10]
+            slugfn = slug
+        metablock = METADATA_TMPL.format(title,
+                                         pubdate, utcoff,
+                                         ", ".join(categories),
+                                         categories[0])
+        #print(metablock)
+        outputs.append((slugfn + ".rst", metablock + outstr + "\n"))
+    log("Finished processing {0}\n".format(fname))
+    return outputs
+
+
+def convert_file(slug, fname, utcoff):
+    """
+    Converts every post in fname. Rather than writing the output and
+    printing progress directly, we return a list of (output filename,
+    reST text), the list of log messages and the images used, so that
+    the caller can emit them in a fixed order however many workers are
+    running.
+    """
+    del _messages[:]
+    _assets.clear()
+    log("opening {0}".format(fname))
+    outputs = render_posts(slug, fname, utcoff, *parse_posts(fname))
+    return outputs, list(_messages), dict(_assets)
+
+
+def iter_wxr_items(fname):
+    """
+    Generator which reads a WordPress WXR export in a single incremental
+    pass, yielding a dict of the fields we use for each published post.
+    Each <item> is discarded once we've read it, so memory use doesn't
+    grow with the size of the export.
+    """
+    channel = None
+    for event, elem in ElementTree.iterparse(fname, events=("start", "end")):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if event == "start":
+            if tag == "channel":
+                channel = elem
+            continue
+        if tag != "item":
+            continue
+        item = {"categories": [], "tags": []}
+        for child in elem:
+            name = child.tag.rsplit("}", 1)[-1]
+            if name == "category":
+                if child.get("domain") == "category":
+                    item["categories"].append(child.text or "")
+                elif child.get("domain") == "post_tag":
+                    item["tags"].append(child.text or "")
+            elif name in WXR_FIELDS and "/excerpt/}" not in child.tag:
+                # (excerpt:encoded would clobber content:encoded)
+                item[name] = child.text or ""
+        elem.clear()
+        if channel is not None:
+            channel.remove(elem)
+        yield item
+
+
+def wxr_utcoff(item, utcoff):
+    """The post's UTC offset, from post_date vs post_date_gmt if we can"""
+    try:
+        local = datetime.datetime.strptime(item["post_date"], WXR_DATE)
+        gmt = datetime.datetime.strptime(item["post_date_gmt"], WXR_DATE)
+    except (KeyError, ValueError) as _exc:
+        return utcoff
+    mins = int((local - gmt).total_seconds()) // 60
+    return "{0}{1:02d}{2:02d}".format("-" if mins < 0 else "+",
+                                      abs(mins) // 60, abs(mins) % 60)
+
+
+def convert_item(item, utcoff):
+    """
+    Converts one post from a WXR export, returning the same things as
+    convert_file.
+    """
+    del _messages[:]
+    _assets.clear()
+    title = item.get("title", "")
+    log("\tpost {0} has title :: {1}".format(item.get("post_id"), title))
+    body = bs4.BeautifulSoup(item.get("encoded", ""), "html.parser")
+    pubdate = item.get("post_date", "").replace(" ", "T")
+    slug = item.get("post_name") or item.get("post_id", "")
+    categories = item["categories"] or ["Uncategorized"]
+    metablock = WXR_METADATA_TMPL.format(
+        title, pubdate, wxr_utcoff(item, utcoff),
+        ", ".join(categories + item["tags"]), categories[0], slug)
+    outfn = "{0}-{1}.rst".format(pubdate[0:10], slug)
+    return ([(outfn, metablock + render_body(body) + "\n")],
+            list(_messages), dict(_assets))
+
+
+def wxr_posts(fname, utcoff, notes):
+    """
+    Yields the convert_one args for each published post in the WXR
+    export fname. We're consumed ahead of the results, so rather than
+    printing how many items we skipped we add that to notes, which the
+    caller prints after the posts' own messages.
+    """
+    skipped = 0
+    for item in iter_wxr_items(fname):
+        if item.get("post_type") != "post" or \
+           item.get("status") != "publish":
+            skipped += 1
+            continue
+        yield fname, convert_item, (item, utcoff)
+    notes.append("skipped {0} items of {1} which aren't published "
+                 "posts".format(skipped, fname))
+
+
+def init_worker(urlrules, assetroot):
+    """Sets up the URL rules and asset root in a worker process"""
+    set_url_rules(urlrules)
+    set_asset_root(assetroot)
+
+
+def publish_assets(assets, outfdir, link, jobs, published):
+    """
+    Copies (or hardlinks) each of assets into the output's ASSET_DIR,
+    skipping any which are already there - being content-addressed, an
+    asset with the right name already has the right contents. Of the
+    names in published, which the previous run's manifest says we put
+    there, those which aren't in assets are removed; anything else in
+    ASSET_DIR is left alone. Returns the number placed.
+    """
+    destdir = os.path.join(outfdir, ASSET_DIR)
+    os.makedirs(destdir, exist_ok=True)
+
+    def place(item):
+        name, srcpath = item
+        dest = os.path.join(destdir, name)
+        if os.path.exists(dest):
+            return 0
+        if link:
+            try:
+                os.link(srcpath, dest)
+                return 1
+            except OSError as _exc:
+                # eg, a different filesystem; fall back to copying
+                pass
+        shutil.copyfile(srcpath, dest + ".part")
+        os.replace(dest + ".part", dest)
+        return 1
+
+    with ThreadPoolExecutor(max_workers=max(4, jobs)) as pool:
+        placed = sum(pool.map(place, sorted(assets.items())))
+    for name in sorted(set(published) - set(assets)):
+        try:
+            os.remove(os.path.join(destdir, name))
+        except FileNotFoundError as _exc:
+            pass
+    return placed
+
+
+def convert_one(args):
+    """ordered_map helper, args is (source, function, function args)"""
+    _fname, func, funcargs = args
+    return func(*funcargs)
+
+
+def ordered_map(func, iterable, jobs, initializer=None, initargs=()):
+    """
+    Generator which yields (args, func(args)) for each item of iterable,
+    in order. With more than one job we use a process pool, but only keep
+    a few items per worker in flight, so work starts as soon as the first
+    item arrives and we never queue the whole of iterable. Each worker
+    calls initializer(*initargs) before starting.
+    """
+    if jobs <= 1:
+        for args in iterable:
+            yield args, func(args)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer,
+                             initargs=initargs) as pool:
+        pending = collections.deque()
+        for args in iterable:
+            pending.append((args, pool.submit(func, args)))
+            if len(pending) >= jobs * 4:
+                args, job = pending.popleft()
+                yield args, job.result()
+        while pending:
+            args, job = pending.popleft()
+            yield args, job.result()
+
+
+def file_digest(fname):
+    """Returns the SHA-256 of fname's contents"""
+    digest = hashlib.sha256()
+    with open(fname, "rb") as inf:
+        for block in iter(lambda: inf.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(outfdir):
+    """
+    Returns the settings and sources recorded by the previous run into
+    outfdir, or (None, {}) if there wasn't one.
+    """
+    try:
+        with open(os.path.join(outfdir, MANIFEST_NAME), "r") as manf:
+            manifest = json.load(manf)
+    except (OSError, ValueError) as _exc:
+        return None, {}
+    return manifest.get("settings"), manifest.get("sources", {})
+
+
+def save_manifest(outfdir, settings, sources):
+    """Writes the manifest for outfdir, replacing any previous one"""
+    manfn = os.path.join(outfdir, MANIFEST_NAME)
+    with open(manfn + ".tmp", "w") as manf:
+        json.dump({"settings": settings, "sources": sources}, manf,
+                  indent=1, sort_keys=True)
+    os.replace(manfn + ".tmp", manfn)
+
+
+def unchanged(fname, entry, stinfo):
+    """
+    Is fname the same as when entry was recorded? If the size and mtime
+    match we take that as a yes, otherwise we compare contents; a touched
+    but identical file gets its entry's mtime refreshed.
+    """
+    if entry is None or entry["size"] != stinfo.st_size:
+        return False
+    if entry["mtime"] == stinfo.st_mtime_ns:
+        return True
+    if entry["digest"] == file_digest(fname):
+        entry["mtime"] = stinfo.st_mtime_ns
+        return True
+    return False
+
 
 if __name__ == "__main__":
     """ main function, where we provide direction. """
 
-    startdir = sys.argv[1]
-    outfdir = sys.argv[2]
+    opts, args = getopt.getopt(sys.argv[1:], "a:fhj:lr:",
+                               ["assets=", "force", "help", "jobs=", "link",
+                                "rules="])
+    dopts = dict(opts)
+    if "-h" in dopts or "--help" in dopts or len(args) < 2:
+        print(__USAGE)
+        sys.exit(0 if len(args) >= 2 else 1)
 
-    # get the list of files to process
-    allposts = get_list_of_posts(startdir, None)
+    jobs = int(dopts.get("--jobs", dopts.get("-j", 1)))
+    startdir = args[0]
+    outfdir = args[1]
 
     utcoff = time.strftime("%z")
 
     if not os.path.exists(outfdir):
         os.makedirs(outfdir)
 
-    for slug in allposts:
-        fname = allposts[slug]
-        print("opening {0}".format(fname))
-        soup = bs4.BeautifulSoup(open(fname, "r"), "html.parser")
-        # How many posts do we have in this file? I really wish that
-        # findNext() was an iterator. Instead, find all the headers,
-        # bodycopy and footer elements, and make the assumption that
-        # they've been returned in associated order. We rely on the
-        # human to check this.
-        post_heads = soup.findAll(name="div", attrs={'class': 'post-headline'})
-        post_bodies = soup.findAll(name="div", attrs={'class': 'post-bodycopy'})
-        post_footers = soup.findAll(name="div", attrs={'class': 'post-footer'})
-
-        if len(post_heads) != len(post_bodies) or len(post_heads) != len(post_footers) \
-           or len(post_bodies) != len(post_footers):
-            # urg
-            print("Differing numbers of headers, bodies and footers in {0}.\n"
-                  "Manual pre-processing required, sorry\n".format(fname))
-            print("headers: {0}\n{1}\n----\n # bodies {2}\n----\nfooters: {3}\n{4}".format(
-                len(post_heads), post_heads, len(post_bodies),
-                len(post_footers), [j for j in post_footers.findAll("a", {"class":"comments-link"})]))
-            continue
-        for idx in range(len(post_heads)):
-            title = get_post_title(post_heads[idx])
-            print("\tidx {0} has title :: {1}".format(idx, title))
-            # Get our list of hrefs
-            post_hrefs = {}
-            for ref in post_bodies[idx].findAll("a"):
-                #print(ref.__dict__)
-                if ref.has_attr('id'):
-                    post_hrefs[ref['id']] = ref.text
-                else:
-                    post_hrefs[ref.text] = ref['href']
-            outstr = tags_r(post_bodies[idx])
-            categories, slugfn, pubdate = get_other_meta(post_footers[idx])
-            if slugfn is None:
-                # new-style footer, have to use a different approach
-                pubdate = slug[0:10]
-                slugfn = slug
-            outfn = os.path.join(outfdir, slugfn) + ".rst"
-            outf = open(outfn, "w")
-            metablock = METADATA_TMPL.format(title,
-                                             pubdate, utcoff,
-                                             ", ".join(categories),
-                                             categories[0])
-            #print(metablock)
-            outf.write(metablock)
-            outf.write(outstr)
-            outf.write("\n")
-            urlblock = ""
-            for k in post_hrefs:
-                urlblock += URL_TMPL.format(k, post_hrefs[k])
-            urlblock = urlblock.replace("http://www.jmcpdotcom.com/rollerhttp",
-                                        "http")
-            urlblock = urlblock.replace(
-                "http://www.jmcpdotcom.com/blog/wp-content/uploads",
-                "")
-            urlblock = urlblock.replace(
-                "http://www.jmcpdotcom.com/blog/wp-includes",
-                "")
-            outf.write(urlblock)
-            outf.write("\n")
-            outf.close()
-        print("Finished processing {0}\n".format(fname))
+    # Anything which changes the output of every post goes in settings,
+    # so that changing it means converting everything again.
+    urlrules = DEFAULT_URL_RULES
+    if "-r" in dopts or "--rules" in dopts:
+        urlrules = read_url_rules(dopts.get("--rules", dopts.get("-r")))
+    set_url_rules(urlrules)
+    assetroot = dopts.get("--assets", dopts.get("-a"))
+    if assetroot is not None:
+        assetroot = os.path.abspath(assetroot)
+    set_asset_root(assetroot)
+    settings = {"utcoff": utcoff,
+                "urlrules": [list(rule) for rule in urlrules],
+                "assets": assetroot}
+    oldsettings, previous = load_manifest(outfdir)
+    reuse = oldsettings == settings and \
+        "-f" not in dopts and "--force" not in dopts
+
+    sources = {}
+    stats = {"unchanged": 0, "converted": 0}
+    notes = []
+
+    if os.path.isfile(startdir):
+        # A WXR export, rather than a tree of pages
+        sourcelist = [(None, startdir)]
+    else:
+        # Slugs and dates come from each page's path, so converting the
+        # current directory mustn't start every one of them with "./"
+        strip = "./" if os.path.normpath(startdir) == "." else None
+        sourcelist = iter_posts(startdir, strip)
+
+    def needs_work():
+        """Yields the convert_one args for each new or changed post"""
+        for slug, fname in sourcelist:
+            stinfo = os.stat(fname)
+            entry = previous.get(fname) if reuse else None
+            if unchanged(fname, entry, stinfo):
+                sources[fname] = entry
+                stats["unchanged"] += 1
+                continue
+            sources[fname] = {
+                "size": stinfo.st_size,
+                "mtime": stinfo.st_mtime_ns,
+                "digest": file_digest(fname),
+                "outputs": [],
+                "assets": {}
+            }
+            if slug is None:
+                yield from wxr_posts(fname, utcoff, notes)
+            else:
+                yield fname, convert_file, (slug, fname, utcoff)
+
+    # Results come back in discovery order, so the log and any output
+    # files written twice end up exactly as a serial run leaves them.
+    converted = set()
+    for (fname, _func, _args), (outputs, messages, assets) in ordered_map(
+            convert_one, needs_work(), jobs, init_worker,
+            (urlrules, assetroot)):
+        for msg in messages:
+            print(msg)
+        for outfn, text in outputs:
+            with open(os.path.join(outfdir, outfn), "w") as outf:
+                outf.write(text)
+        # A WXR export is one source with many posts
+        sources[fname]["outputs"] = sorted(set(
+            sources[fname]["outputs"]) | set(
+                outfn for outfn, _text in outputs))
+        sources[fname]["assets"].update(assets)
+        if fname not in converted:
+            converted.add(fname)
+            stats["converted"] += 1
+    for msg in notes:
+        print(msg)
+    print("{converted} source files converted, {unchanged} "
+          "unchanged".format(**stats))
+
+    # Remove whatever the previous run wrote that nothing produces now,
+    # whether its source has gone away or just stopped producing it.
+    current = set(outfn for entry in sources.values()
+                  for outfn in entry["outputs"])
+    stale = set(outfn for entry in previous.values()
+                for outfn in entry["outputs"]) - current
+    for outfn in sorted(stale):
+        print("removing {0}".format(outfn))
+        try:
+            os.remove(os.path.join(outfdir, outfn))
+        except FileNotFoundError as _exc:
+            pass
+
+    if assetroot is not None:
+        allassets = {}
+        for entry in sources.values():
+            allassets.update(entry.get("assets", {}))
+        published = set(name for entry in previous.values()
+                        for name in entry.get("assets", {}))
+        placed = publish_assets(allassets, outfdir,
+                                "-l" in dopts or "--link" in dopts, jobs,
+                                published)
+        print("{0} images used, {1} newly placed in {2}".format(
+            len(allassets), placed, os.path.join(outfdir, ASSET_DIR)))
+
+    save_manifest(outfdir, settings, sources)